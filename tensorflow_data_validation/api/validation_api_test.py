@@ -35,6 +35,30 @@ from tensorflow_metadata.proto.v0 import schema_pb2
 from tensorflow_metadata.proto.v0 import statistics_pb2
 
 
+# Serialized protos keyed by (text, message type), so that a literal shared by
+# several tests is only run through the (slow) text-format parser once per test
+# process. Later uses decode the binary wire format instead.
+_SERIALIZED_PROTOS = {}
+
+
+def _parse_proto(text, message_type):
+  """Parses a text-format proto, reusing an earlier parse of the same text.
+
+  Args:
+    text: A text-format proto literal.
+    message_type: The proto message class to parse the text into.
+
+  Returns:
+    A new `message_type` instance which the caller is free to mutate.
+  """
+  key = (text, message_type)
+  serialized = _SERIALIZED_PROTOS.get(key)
+  if serialized is None:
+    serialized = text_format.Parse(text, message_type()).SerializeToString()
+    _SERIALIZED_PROTOS[key] = serialized
+  return message_type.FromString(serialized)
+
+
 IDENTIFY_ANOMALOUS_EXAMPLES_VALID_INPUTS = [
     {
         'testcase_name':
@@ -179,6 +203,144 @@ IDENTIFY_ANOMALOUS_EXAMPLES_VALID_INPUTS = [
 
 class ValidationApiTest(absltest.TestCase):
 
+  @classmethod
+  def setUpClass(cls):
+    super(ValidationApiTest, cls).setUpClass()
+    # Expected anomaly infos shared by several tests. They are only read by the
+    # tests, so they are parsed once for the whole test case.
+    # pylint: disable=line-too-long
+    cls._annotated_enum_anomaly_info = text_format.Parse(
+        """
+        description: "Examples contain values missing from the schema: b (?).  The Linfty distance between current and previous is 0.25 (up to six significant digits), above the threshold 0.01. The feature value with maximum difference is: b"
+        severity: ERROR
+        short_description: "Multiple errors"
+        reason {
+          type: ENUM_TYPE_UNEXPECTED_STRING_VALUES
+          short_description: "Unexpected string values"
+          description: "Examples contain values missing from the schema: b (?). "
+        }
+        reason {
+          type: COMPARATOR_L_INFTY_HIGH
+          short_description: "High Linfty distance between current and previous"
+          description: "The Linfty distance between current and previous is 0.25 (up to six significant digits), above the threshold 0.01. The feature value with maximum difference is: b"
+        }""", anomalies_pb2.AnomalyInfo())
+
+    cls._bar_anomaly_info = text_format.Parse(
+        """
+        short_description: "High Linfty distance between training and serving"
+        description: "The Linfty distance between training and serving is 0.2 (up to six significant digits), above the threshold 0.1. The feature value with maximum difference is: a"
+        severity: ERROR
+        reason {
+          type: COMPARATOR_L_INFTY_HIGH
+          short_description: "High Linfty distance between training and serving"
+          description: "The Linfty distance between training and serving is 0.2 (up to six significant digits), above the threshold 0.1. The feature value with maximum difference is: a"
+        }""", anomalies_pb2.AnomalyInfo())
+    # pylint: enable=line-too-long
+
+    # Fixtures shared by several tests. Tests that mutate one of these must work
+    # on their own copy.
+    cls._enum_schema = text_format.Parse(
+        """
+        string_domain {
+          name: "MyAloneEnum"
+          value: "A"
+          value: "B"
+          value: "C"
+        }
+        feature {
+          name: "annotated_enum"
+          value_count {
+            min:1
+            max:1
+          }
+          presence {
+            min_count: 1
+          }
+          type: BYTES
+          domain: "MyAloneEnum"
+        }
+        feature {
+          name: "ignore_this"
+          lifecycle_stage: DEPRECATED
+          value_count {
+            min:1
+          }
+          presence {
+            min_count: 1
+          }
+          type: BYTES
+        }
+        """, schema_pb2.Schema())
+
+    cls._enum_statistics = text_format.Parse(
+        """
+        datasets{
+          num_examples: 10
+          features {
+            name: 'annotated_enum'
+            type: STRING
+            string_stats {
+              common_stats {
+                num_missing: 3
+                num_non_missing: 7
+                min_num_values: 1
+                max_num_values: 1
+              }
+              unique: 3
+              rank_histogram {
+                buckets {
+                  label: "D"
+                  sample_count: 1
+                }
+              }
+            }
+          }
+        }
+        """, statistics_pb2.DatasetFeatureStatisticsList())
+
+    cls._enum_anomaly_info = text_format.Parse(
+        """
+        description: "Examples contain values missing from the schema: D (?). "
+        severity: ERROR
+        short_description: "Unexpected string values"
+        reason {
+          type: ENUM_TYPE_UNEXPECTED_STRING_VALUES
+          short_description: "Unexpected string values"
+          description: "Examples contain values missing from the schema: D (?). "
+        }
+        """, anomalies_pb2.AnomalyInfo())
+
+    cls._environment_schema = text_format.Parse(
+        """
+        default_environment: "TRAINING"
+        default_environment: "SERVING"
+        feature {
+          name: "label"
+          not_in_environment: "SERVING"
+          value_count { min: 1 max: 1 }
+          presence { min_count: 1 }
+          type: BYTES
+        }
+        feature {
+          name: "feature"
+          value_count { min: 1 max: 1 }
+          presence { min_count: 1 }
+          type: BYTES
+        }
+        """, schema_pb2.Schema())
+
+    cls._missing_label_anomaly_info = text_format.Parse(
+        """
+        description: "Column is completely missing"
+        severity: ERROR
+        short_description: "Column dropped"
+        reason {
+          type: SCHEMA_MISSING_COLUMN
+          short_description: "Column dropped"
+          description: "Column is completely missing"
+        }
+        """, anomalies_pb2.AnomalyInfo())
+
   def test_infer_schema(self):
     statistics = text_format.Parse(
         """
@@ -219,10 +381,10 @@ class ValidationApiTest(absltest.TestCase):
     # Infer the schema from the stats.
     actual_schema = validation_api.infer_schema(statistics,
                                                 infer_feature_shape=False)
-    self.assertEqual(actual_schema, expected_schema)
+    self._assert_proto_equal(actual_schema, expected_schema)
 
   def test_infer_schema_with_string_domain(self):
-    statistics = text_format.Parse(
+    statistics = _parse_proto(
         """
         datasets {
           num_examples: 7
@@ -260,7 +422,7 @@ class ValidationApiTest(absltest.TestCase):
             }
           }
         }
-        """, statistics_pb2.DatasetFeatureStatisticsList())
+        """, statistics_pb2.DatasetFeatureStatisticsList)
 
     expected_schema = text_format.Parse(
         """
@@ -287,10 +449,10 @@ class ValidationApiTest(absltest.TestCase):
 
     # Infer the schema from the stats.
     actual_schema = validation_api.infer_schema(statistics)
-    self.assertEqual(actual_schema, expected_schema)
+    self._assert_proto_equal(actual_schema, expected_schema)
 
   def test_infer_schema_without_string_domain(self):
-    statistics = text_format.Parse(
+    statistics = _parse_proto(
         """
         datasets {
           num_examples: 7
@@ -328,7 +490,7 @@ class ValidationApiTest(absltest.TestCase):
             }
           }
         }
-        """, statistics_pb2.DatasetFeatureStatisticsList())
+        """, statistics_pb2.DatasetFeatureStatisticsList)
 
     expected_schema = text_format.Parse(
         """
@@ -349,7 +511,7 @@ class ValidationApiTest(absltest.TestCase):
     # Infer the schema from the stats.
     actual_schema = validation_api.infer_schema(statistics,
                                                 max_string_domain_size=2)
-    self.assertEqual(actual_schema, expected_schema)
+    self._assert_proto_equal(actual_schema, expected_schema)
 
   def test_infer_schema_with_infer_shape(self):
     statistics = text_format.Parse(
@@ -432,7 +594,7 @@ class ValidationApiTest(absltest.TestCase):
     # Infer the schema from the stats.
     actual_schema = validation_api.infer_schema(statistics,
                                                 infer_feature_shape=True)
-    self.assertEqual(actual_schema, expected_schema)
+    self._assert_proto_equal(actual_schema, expected_schema)
 
   def test_infer_schema_invalid_statistics_input(self):
     with self.assertRaisesRegexp(
@@ -449,6 +611,14 @@ class ValidationApiTest(absltest.TestCase):
                                  '.*statistics proto with one dataset.*'):
       _ = validation_api.infer_schema(statistics)
 
+  def _assert_proto_equal(self, actual, expected):
+    # Compare the deterministic wire format first, which is much cheaper than
+    # the field-by-field proto comparison. Only if the bytes differ fall back
+    # to assertEqual, which decides the outcome and gives a readable diff.
+    if (actual.SerializeToString(deterministic=True) !=
+        expected.SerializeToString(deterministic=True)):
+      self.assertEqual(actual, expected)
+
   def _assert_equal_anomalies(self, actual_anomalies, expected_anomalies):
     # Check if the actual anomalies matches with the expected anomalies.
     for feature_name in expected_anomalies:
@@ -457,83 +627,17 @@ class ValidationApiTest(absltest.TestCase):
       actual_anomalies.anomaly_info[feature_name].ClearField('diff_regions')
       actual_anomalies.anomaly_info[feature_name].ClearField('path')
 
-      self.assertEqual(actual_anomalies.anomaly_info[feature_name],
-                       expected_anomalies[feature_name])
+      self._assert_proto_equal(actual_anomalies.anomaly_info[feature_name],
+                               expected_anomalies[feature_name])
     self.assertEqual(
         len(actual_anomalies.anomaly_info), len(expected_anomalies))
 
   def test_update_schema(self):
-    schema = text_format.Parse(
-        """
-        string_domain {
-          name: "MyAloneEnum"
-          value: "A"
-          value: "B"
-          value: "C"
-        }
-        feature {
-          name: "annotated_enum"
-          value_count {
-            min:1
-            max:1
-          }
-          presence {
-            min_count: 1
-          }
-          type: BYTES
-          domain: "MyAloneEnum"
-        }
-        feature {
-          name: "ignore_this"
-          lifecycle_stage: DEPRECATED
-          value_count {
-            min:1
-          }
-          presence {
-            min_count: 1
-          }
-          type: BYTES
-        }
-        """, schema_pb2.Schema())
-    statistics = text_format.Parse(
-        """
-        datasets{
-          num_examples: 10
-          features {
-            name: 'annotated_enum'
-            type: STRING
-            string_stats {
-              common_stats {
-                num_missing: 3
-                num_non_missing: 7
-                min_num_values: 1
-                max_num_values: 1
-              }
-              unique: 3
-              rank_histogram {
-                buckets {
-                  label: "D"
-                  sample_count: 1
-                }
-              }
-            }
-          }
-        }
-        """, statistics_pb2.DatasetFeatureStatisticsList())
-    expected_anomalies = {
-        'annotated_enum':
-            text_format.Parse(
-                """
-      description: "Examples contain values missing from the schema: D (?). "
-      severity: ERROR
-      short_description: "Unexpected string values"
-      reason {
-        type: ENUM_TYPE_UNEXPECTED_STRING_VALUES
-        short_description: "Unexpected string values"
-        description: "Examples contain values missing from the schema: D (?). "
-      }
-            """, anomalies_pb2.AnomalyInfo())
-    }
+    # The expected updated schema is built by mutating this schema.
+    schema = schema_pb2.Schema()
+    schema.CopyFrom(self._enum_schema)
+    statistics = self._enum_statistics
+    expected_anomalies = {'annotated_enum': self._enum_anomaly_info}
 
     # Validate the stats.
     anomalies = validation_api.validate_statistics(statistics, schema)
@@ -545,7 +649,7 @@ class ValidationApiTest(absltest.TestCase):
     schema_util.get_domain(
         expected_updated_schema,
         types.FeaturePath(['annotated_enum'])).value.append('D')
-    self.assertEqual(actual_updated_schema, expected_updated_schema)
+    self._assert_proto_equal(actual_updated_schema, expected_updated_schema)
 
     # Verify that there are no anomalies with the updated schema.
     actual_updated_anomalies = validation_api.validate_statistics(
@@ -566,108 +670,15 @@ class ValidationApiTest(absltest.TestCase):
       _ = validation_api.update_schema(schema, {})
 
   def test_validate_stats(self):
-    schema = text_format.Parse(
-        """
-        string_domain {
-          name: "MyAloneEnum"
-          value: "A"
-          value: "B"
-          value: "C"
-        }
-        feature {
-          name: "annotated_enum"
-          value_count {
-            min:1
-            max:1
-          }
-          presence {
-            min_count: 1
-          }
-          type: BYTES
-          domain: "MyAloneEnum"
-        }
-        feature {
-          name: "ignore_this"
-          lifecycle_stage: DEPRECATED
-          value_count {
-            min:1
-          }
-          presence {
-            min_count: 1
-          }
-          type: BYTES
-        }
-        """, schema_pb2.Schema())
-    statistics = text_format.Parse(
-        """
-        datasets{
-          num_examples: 10
-          features {
-            name: 'annotated_enum'
-            type: STRING
-            string_stats {
-              common_stats {
-                num_missing: 3
-                num_non_missing: 7
-                min_num_values: 1
-                max_num_values: 1
-              }
-              unique: 3
-              rank_histogram {
-                buckets {
-                  label: "D"
-                  sample_count: 1
-                }
-              }
-            }
-          }
-        }
-        """, statistics_pb2.DatasetFeatureStatisticsList())
-    expected_anomalies = {
-        'annotated_enum':
-            text_format.Parse(
-                """
-      description: "Examples contain values missing from the schema: D (?). "
-      severity: ERROR
-      short_description: "Unexpected string values"
-      reason {
-        type: ENUM_TYPE_UNEXPECTED_STRING_VALUES
-        short_description: "Unexpected string values"
-        description: "Examples contain values missing from the schema: D (?). "
-      }
-            """, anomalies_pb2.AnomalyInfo())
-    }
+    schema = self._enum_schema
+    statistics = self._enum_statistics
+    expected_anomalies = {'annotated_enum': self._enum_anomaly_info}
 
     # Validate the stats.
     anomalies = validation_api.validate_statistics(statistics, schema)
     self._assert_equal_anomalies(anomalies, expected_anomalies)
 
   # pylint: disable=line-too-long
-  _annotated_enum_anomaly_info = """
-            description: "Examples contain values missing from the schema: b (?).  The Linfty distance between current and previous is 0.25 (up to six significant digits), above the threshold 0.01. The feature value with maximum difference is: b"
-            severity: ERROR
-            short_description: "Multiple errors"
-            reason {
-              type: ENUM_TYPE_UNEXPECTED_STRING_VALUES
-              short_description: "Unexpected string values"
-              description: "Examples contain values missing from the schema: b (?). "
-            }
-            reason {
-              type: COMPARATOR_L_INFTY_HIGH
-              short_description: "High Linfty distance between current and previous"
-              description: "The Linfty distance between current and previous is 0.25 (up to six significant digits), above the threshold 0.01. The feature value with maximum difference is: b"
-            }"""
-
-  _bar_anomaly_info = """
-            short_description: "High Linfty distance between training and serving"
-            description: "The Linfty distance between training and serving is 0.2 (up to six significant digits), above the threshold 0.1. The feature value with maximum difference is: a"
-            severity: ERROR
-            reason {
-              type: COMPARATOR_L_INFTY_HIGH
-              short_description: "High Linfty distance between training and serving"
-              description: "The Linfty distance between training and serving is 0.2 (up to six significant digits), above the threshold 0.1. The feature value with maximum difference is: a"
-            }"""
-
   def test_validate_stats_with_previous_stats(self):
     statistics = text_format.Parse(
         """
@@ -715,8 +726,7 @@ class ValidationApiTest(absltest.TestCase):
         """, schema_pb2.Schema())
 
     expected_anomalies = {
-        'annotated_enum': text_format.Parse(self._annotated_enum_anomaly_info,
-                                            anomalies_pb2.AnomalyInfo())
+        'annotated_enum': self._annotated_enum_anomaly_info
     }
     # Validate the stats.
     anomalies = validation_api.validate_statistics(
@@ -779,8 +789,7 @@ class ValidationApiTest(absltest.TestCase):
         }""", schema_pb2.Schema())
 
     expected_anomalies = {
-        'bar': text_format.Parse(self._bar_anomaly_info,
-                                 anomalies_pb2.AnomalyInfo())
+        'bar': self._bar_anomaly_info
     }
     # Validate the stats.
     anomalies = validation_api.validate_statistics(
@@ -806,38 +815,10 @@ class ValidationApiTest(absltest.TestCase):
           }
         }""", statistics_pb2.DatasetFeatureStatisticsList())
 
-    schema = text_format.Parse(
-        """
-        default_environment: "TRAINING"
-        default_environment: "SERVING"
-        feature {
-          name: "label"
-          not_in_environment: "SERVING"
-          value_count { min: 1 max: 1 }
-          presence { min_count: 1 }
-          type: BYTES
-        }
-        feature {
-          name: "feature"
-          value_count { min: 1 max: 1 }
-          presence { min_count: 1 }
-          type: BYTES
-        }
-        """, schema_pb2.Schema())
+    schema = self._environment_schema
 
     expected_anomalies_training = {
-        'label':
-            text_format.Parse(
-                """
-            description: "Column is completely missing"
-            severity: ERROR
-            short_description: "Column dropped"
-            reason {
-              type: SCHEMA_MISSING_COLUMN
-              short_description: "Column dropped"
-              description: "Column is completely missing"
-            }
-            """, anomalies_pb2.AnomalyInfo())
+        'label': self._missing_label_anomaly_info
     }
     # Validate the stats in TRAINING environment.
     anomalies_training = validation_api.validate_statistics(
@@ -979,10 +960,8 @@ class ValidationApiTest(absltest.TestCase):
         """, schema_pb2.Schema())
 
     expected_anomalies = {
-        'bar': text_format.Parse(self._bar_anomaly_info,
-                                 anomalies_pb2.AnomalyInfo()),
-        'annotated_enum': text_format.Parse(self._annotated_enum_anomaly_info,
-                                            anomalies_pb2.AnomalyInfo())
+        'bar': self._bar_anomaly_info,
+        'annotated_enum': self._annotated_enum_anomaly_info
     }
 
     # Validate the stats.
@@ -1089,41 +1068,10 @@ class ValidationApiTest(absltest.TestCase):
 
   def test_validate_instance(self):
     instance = pa.Table.from_arrays([pa.array([['D']])], ['annotated_enum'])
-    schema = text_format.Parse(
-        """
-        string_domain {
-          name: "MyAloneEnum"
-          value: "A"
-          value: "B"
-          value: "C"
-        }
-        feature {
-          name: "annotated_enum"
-          value_count {
-            min:1
-            max:1
-          }
-          presence {
-            min_count: 1
-          }
-          type: BYTES
-          domain: "MyAloneEnum"
-        }
-        feature {
-          name: "ignore_this"
-          lifecycle_stage: DEPRECATED
-          value_count {
-            min:1
-          }
-          presence {
-            min_count: 1
-          }
-          type: BYTES
-        }
-        """, schema_pb2.Schema())
+    schema = self._enum_schema
     expected_anomalies = {
         'annotated_enum':
-            text_format.Parse(
+            _parse_proto(
                 """
       description: "Examples contain values missing from the schema: D "
         "(~100%). "
@@ -1135,7 +1083,7 @@ class ValidationApiTest(absltest.TestCase):
         description: "Examples contain values missing from the schema: D "
           "(~100%). "
       }
-            """, anomalies_pb2.AnomalyInfo())
+            """, anomalies_pb2.AnomalyInfo)
     }
     options = stats_options.StatsOptions(schema=schema)
     anomalies = validation_api.validate_instance(instance, options)
@@ -1182,7 +1130,7 @@ class ValidationApiTest(absltest.TestCase):
         """, schema_pb2.Schema())
     expected_anomalies = {
         'annotated_enum':
-            text_format.Parse(
+            _parse_proto(
                 """
       description: "Examples contain values missing from the schema: D "
         "(~100%). "
@@ -1194,7 +1142,7 @@ class ValidationApiTest(absltest.TestCase):
         description: "Examples contain values missing from the schema: D "
           "(~100%). "
       }
-            """, anomalies_pb2.AnomalyInfo())
+            """, anomalies_pb2.AnomalyInfo)
     }
     options = stats_options.StatsOptions(schema=schema)
     anomalies = validation_api.validate_instance(instance, options)
@@ -1202,40 +1150,12 @@ class ValidationApiTest(absltest.TestCase):
 
   def test_validate_instance_environment(self):
     instance = pa.Table.from_arrays([pa.array([['A']])], ['feature'])
-    schema = text_format.Parse(
-        """
-        default_environment: "TRAINING"
-        default_environment: "SERVING"
-        feature {
-          name: "label"
-          not_in_environment: "SERVING"
-          value_count { min: 1 max: 1 }
-          presence { min_count: 1 }
-          type: BYTES
-        }
-        feature {
-          name: "feature"
-          value_count { min: 1 max: 1 }
-          presence { min_count: 1 }
-          type: BYTES
-        }
-        """, schema_pb2.Schema())
+    schema = self._environment_schema
     options = stats_options.StatsOptions(schema=schema)
 
     # Validate the instance in TRAINING environment.
     expected_anomalies_training = {
-        'label':
-            text_format.Parse(
-                """
-            description: "Column is completely missing"
-            severity: ERROR
-            short_description: "Column dropped"
-            reason {
-              type: SCHEMA_MISSING_COLUMN
-              short_description: "Column dropped"
-              description: "Column is completely missing"
-            }
-            """, anomalies_pb2.AnomalyInfo())
+        'label': self._missing_label_anomaly_info
     }
     anomalies_training = validation_api.validate_instance(
         instance, options, environment='TRAINING')
@@ -1249,24 +1169,7 @@ class ValidationApiTest(absltest.TestCase):
 
   def test_validate_instance_invalid_environment(self):
     instance = pa.Table.from_arrays([pa.array([['A']])], ['feature'])
-    schema = text_format.Parse(
-        """
-        default_environment: "TRAINING"
-        default_environment: "SERVING"
-        feature {
-          name: "label"
-          not_in_environment: "SERVING"
-          value_count { min: 1 max: 1 }
-          presence { min_count: 1 }
-          type: BYTES
-        }
-        feature {
-          name: "feature"
-          value_count { min: 1 max: 1 }
-          presence { min_count: 1 }
-          type: BYTES
-        }
-        """, schema_pb2.Schema())
+    schema = self._environment_schema
     options = stats_options.StatsOptions(schema=schema)
 
     with self.assertRaisesRegexp(
@@ -513,7 +513,7 @@ def _make_feature_stats_proto(
   """
   # Create a new FeatureNameStatistics proto.
   result = statistics_pb2.FeatureNameStatistics()
-  result.path.CopyFrom(feature_path.to_proto())
+  result.path.step.extend(feature_path.steps())
   # Set the feature type.
   # If we have a categorical feature, we preserve the type to be the original
   # INT type. Currently we don't set the type if we cannot infer it, which
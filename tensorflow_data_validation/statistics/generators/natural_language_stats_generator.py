@@ -52,6 +52,13 @@ _VALUES_THRESHOLD = 100
 _DOMAIN_INFO = 'domain_info'
 _NL_MATCH_RATIO = 'natural_language_match_rate'
 
+# Bytes treated as whitespace by bytes.split(). str.split() additionally treats
+# the ASCII information separators (\x1c-\x1f) as whitespace.
+_BYTES_WHITESPACE = np.array(
+    [ord(c) for c in ' \t\n\r\x0b\x0c'], dtype=np.uint8)
+_STR_WHITESPACE = np.append(
+    _BYTES_WHITESPACE, np.arange(0x1c, 0x20, dtype=np.uint8))
+
 
 class _PartialNLStats(object):
   """Partial feature stats for natural language."""
@@ -75,13 +82,119 @@ class _PartialNLStats(object):
 
 
 class NLClassifierInterface(six.with_metaclass(abc.ABCMeta)):
-  """Interface for an NL classifier."""
+  """Interface for an NL classifier.
+
+  NLStatsGenerator classifies the values of each batch with a single call to
+  `classify_batch`. Classifiers that can classify many values at once (e.g.,
+  using numpy or a model) should override it; `classify` is used by the default
+  implementation.
+  """
 
   @abc.abstractmethod
   def classify(self, value):
     """Should return True iff value is classified as NL."""
     raise NotImplementedError()
 
+  def classify_batch(self, values):
+    """Classifies a batch of values.
+
+    By default `classify` is called on each value. Subclasses can override this
+    to classify the whole batch at once.
+
+    Args:
+      values: A flattened arrow array of values.
+
+    Returns:
+      A boolean numpy array which is True iff the corresponding value is
+      classified as NL.
+    """
+    classify_vec = np.vectorize(self.classify, otypes=[np.bool])
+    return classify_vec(values.to_pandas())
+
+
+def _get_offsets_and_data(values):
+  """Returns the value offsets and the data bytes of a binary or string array.
+
+  Args:
+    values: A BinaryArray or StringArray.
+
+  Returns:
+    A tuple of a numpy array of len(values) + 1 offsets and a numpy uint8 array
+    of the bytes spanned by the values. Offsets are relative to the underlying
+    data buffer, i.e. the first value starts at data[0] and offsets[0].
+  """
+  _, offsets_buffer, data_buffer = values.buffers()
+  offsets = np.frombuffer(offsets_buffer, dtype=np.int32)[
+      values.offset:values.offset + len(values) + 1]
+  if data_buffer is None:
+    data = np.empty(0, dtype=np.uint8)
+  else:
+    data = np.frombuffer(data_buffer, dtype=np.uint8)[offsets[0]:offsets[-1]]
+  return offsets, data
+
+
+def _get_word_counts_and_lengths(
+    values, crop_at_length):
+  """Computes the number of words and total word length of each value.
+
+  The result is the same as computing `len(words)` and the sum of the lengths of
+  `words = value[0:crop_at_length].split()` for each value, but is computed
+  directly on the buffers of the arrow array.
+
+  Args:
+    values: A BinaryArray or StringArray.
+    crop_at_length: The number of leading characters of each value to consider.
+
+  Returns:
+    A tuple of two numpy arrays containing the number of words and the total
+    length of the words of each value, or None if the values have to be decoded
+    to be split (i.e., non-ASCII unicode strings).
+  """
+  offsets, data = _get_offsets_and_data(values)
+  if pa.types.is_string(values.type):
+    # Unicode strings are cropped and split on code points, which only
+    # correspond to bytes if the strings are ASCII.
+    if data.size and data.max() >= 0x80:
+      return None
+    whitespace = _STR_WHITESPACE
+  else:
+    whitespace = _BYTES_WHITESPACE
+  starts = offsets[:-1] - offsets[0]
+  ends = np.minimum(offsets[1:] - offsets[0], starts + crop_at_length)
+
+  is_word_char = ~np.isin(data, whitespace)
+  # A word starts at a non-whitespace byte that either follows a whitespace or
+  # is the first byte of a value.
+  follows_whitespace = np.empty_like(is_word_char)
+  follows_whitespace[1:] = ~is_word_char[:-1]
+  follows_whitespace[starts[starts < data.size]] = True
+  is_word_start = is_word_char & follows_whitespace
+
+  word_char_cumsum = np.zeros(data.size + 1, dtype=np.int64)
+  np.cumsum(is_word_char, out=word_char_cumsum[1:])
+  word_start_cumsum = np.zeros(data.size + 1, dtype=np.int64)
+  np.cumsum(is_word_start, out=word_start_cumsum[1:])
+  return (word_start_cumsum[ends] - word_start_cumsum[starts],
+          word_char_cumsum[ends] - word_char_cumsum[starts])
+
+
+def _has_non_utf8_values(values):
+  """Returns True iff some value of a flattened array is not valid UTF-8.
+
+  Only binary values can be invalid. If all the bytes of a binary array are
+  ASCII the array is valid as a whole, otherwise each value is decoded.
+
+  Args:
+    values: A flattened arrow array of values.
+  """
+  if not pa.types.is_binary(values.type):
+    return False
+  _, data = _get_offsets_and_data(values)
+  if not data.size or data.max() < 0x80:
+    return False
+  return any(value is not None and stats_util.maybe_get_utf8(value) is None
+             for value in values.to_pylist())
+
 
 class AverageWordHeuristicNLClassifier(NLClassifierInterface):
   """A simple heuristic based on average word length.
@@ -109,16 +222,27 @@ class AverageWordHeuristicNLClassifier(NLClassifierInterface):
     words = value[0:self._crop_at_length].split()
     if not words:
       return False
-    # Expanded for loop efficiency.
-    sum_word_length = 0
-    for w in words:
-      sum_word_length += len(w)
-    avg_word_length = float(sum_word_length) / len(words)
+    avg_word_length = float(sum(map(len, words))) / len(words)
     if (self._avg_word_length_min <= avg_word_length <=
         self._avg_word_length_max and len(words) >= self._min_words_per_value):
       return True
     return False
 
+  def classify_batch(self, values):
+    word_counts_and_lengths = None
+    if pa.types.is_binary(values.type) or pa.types.is_string(values.type):
+      word_counts_and_lengths = _get_word_counts_and_lengths(
+          values, self._crop_at_length)
+    if word_counts_and_lengths is None:
+      return super(AverageWordHeuristicNLClassifier,
+                   self).classify_batch(values)
+    num_words, sum_word_length = word_counts_and_lengths
+    avg_word_length = sum_word_length / np.maximum(num_words, 1)
+    return ((num_words > 0) &
+            (num_words >= self._min_words_per_value) &
+            (avg_word_length >= self._avg_word_length_min) &
+            (avg_word_length <= self._avg_word_length_max))
+
 
 class NLStatsGenerator(stats_generator.CombinerFeatureStatsGenerator):
   """Generates feature level statistics for natural language stats.
@@ -189,19 +313,14 @@ class NLStatsGenerator(stats_generator.CombinerFeatureStatsGenerator):
       accumulator.invalidate = True
       return accumulator
 
-    def _is_non_utf8(value):
-      return (isinstance(value, bytes) and
-              stats_util.maybe_get_utf8(value) is None)
-
-    is_non_utf_vec = np.vectorize(_is_non_utf8, otypes=[np.bool])
-    classify_vec = np.vectorize(self._classifier.classify, otypes=[np.bool])
     for feature_array in input_column.data.iterchunks():
-      values = arrow_util.FlattenListArray(feature_array).to_pandas()
-      if np.any(is_non_utf_vec(values)):
+      flattened_values = arrow_util.FlattenListArray(feature_array)
+      if _has_non_utf8_values(flattened_values):
         accumulator.invalidate = True
         return accumulator
-      accumulator.considered += values.size
-      accumulator.matched += np.sum(classify_vec(values))
+      accumulator.considered += len(flattened_values)
+      accumulator.matched += np.sum(
+          self._classifier.classify_batch(flattened_values))
     return accumulator
 
   def merge_accumulators(
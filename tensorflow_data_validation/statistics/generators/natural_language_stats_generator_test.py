@@ -18,6 +18,7 @@ from __future__ import division
 
 from __future__ import print_function
 
+import numpy as np
 from tensorflow_data_validation.pyarrow_tf import pyarrow as pa
 from tensorflow_data_validation.statistics.generators import natural_language_stats_generator as nlsg
 from tensorflow_data_validation.utils import test_util
@@ -33,6 +34,21 @@ class _FakeHeuristic(nlsg.NLClassifierInterface):
     return single_value == 'MATCH'
 
 
+class _AlwaysMatchHeuristic(nlsg.NLClassifierInterface):
+
+  def classify(self, single_value):
+    return True
+
+
+class _FakeBatchHeuristic(nlsg.NLClassifierInterface):
+
+  def classify(self, single_value):
+    raise AssertionError('classify should not be called.')
+
+  def classify_batch(self, values):
+    return np.array(values.to_pylist()) == 'MATCH'
+
+
 class NaturalLanguageStatsGeneratorTest(
     test_util.CombinerFeatureStatsGeneratorTest):
 
@@ -75,6 +91,28 @@ class NaturalLanguageStatsGeneratorTest(
         nlsg.AverageWordHeuristicNLClassifier(
             min_words_per_value=6).classify(text_5_words))
 
+  def test_average_word_heuristic_classify_batch(self):
+    values = [
+        '', '  ', 'Hello this is some text', 'Hello  this\tis\nsome text',
+        'xosuhddsofuhg123fdgosh', 'a b c d e f g h',
+        u'\u00dcn\u00efc\u00f6d\u00e9 is fine too'
+    ]
+    classifier = nlsg.AverageWordHeuristicNLClassifier(crop_at_length=20)
+    expected = [classifier.classify(v) for v in values]
+    self.assertEqual(
+        expected,
+        classifier.classify_batch(pa.array(values, type=pa.string())).tolist())
+    self.assertEqual(
+        [classifier.classify(v.encode('utf-8')) for v in values],
+        classifier.classify_batch(
+            pa.array([v.encode('utf-8') for v in values],
+                     type=pa.binary())).tolist())
+    # Sliced arrays only classify the values in the slice.
+    self.assertEqual(
+        expected[2:5],
+        classifier.classify_batch(
+            pa.array(values, type=pa.string()).slice(2, 3)).tolist())
+
   def test_nl_generator_bad_initialization(self):
     """Tests bad initialization values."""
     with self.assertRaisesRegexp(
@@ -116,6 +154,23 @@ class NaturalLanguageStatsGeneratorTest(
                 name='natural_language_match_rate', num=1.0)
         ]))
 
+  def test_nl_generator_classify_batch(self):
+    """Tests generator classifies values with classify_batch."""
+    input_batches = [
+        pa.Column.from_array(
+            'feature', pa.array([['MATCH', 'MATCH', 'Nope'], ['MATCH']])),
+        pa.Column.from_array('feature', pa.array([['MATCH'], None])),
+    ]
+    generator = nlsg.NLStatsGenerator(_FakeBatchHeuristic(), values_threshold=5)
+    self.assertCombinerOutputEqual(
+        input_batches, generator,
+        statistics_pb2.FeatureNameStatistics(custom_stats=[
+            statistics_pb2.CustomStatistic(
+                name='domain_info', str='natural_language_domain {}'),
+            statistics_pb2.CustomStatistic(
+                name='natural_language_match_rate', num=0.8)
+        ]))
+
   def test_nl_generator_utf8_check(self):
     """Tests generator utf8 check with fake heuristic."""
     # Expected to give 6 matches.
@@ -132,6 +187,24 @@ class NaturalLanguageStatsGeneratorTest(
     self.assertCombinerOutputEqual(input_batches, generator,
                                    statistics_pb2.FeatureNameStatistics())
 
+  def test_nl_generator_utf8_non_ascii_check(self):
+    """Tests generator utf8 check with valid non-ASCII bytes."""
+    input_batches = [
+        pa.Column.from_array(
+            'feature', pa.array([[b'MATCH', u'\u00e9'.encode('utf-8')]])),
+        pa.Column.from_array('feature', pa.array([[b'MATCH'], None])),
+    ]
+    generator = nlsg.NLStatsGenerator(
+        _AlwaysMatchHeuristic(), values_threshold=3)
+    self.assertCombinerOutputEqual(
+        input_batches, generator,
+        statistics_pb2.FeatureNameStatistics(custom_stats=[
+            statistics_pb2.CustomStatistic(
+                name='domain_info', str='natural_language_domain {}'),
+            statistics_pb2.CustomStatistic(
+                name='natural_language_match_rate', num=1.0)
+        ]))
+
   def test_nl_generator_invalidation_check(self):
     """Tests generator invalidation with fake heuristic."""
     # Expected to give 6 matches.
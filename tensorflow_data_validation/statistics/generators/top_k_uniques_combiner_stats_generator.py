@@ -19,10 +19,9 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
-import six
+import numpy as np
 from tensorflow_data_validation import types
 from tensorflow_data_validation.arrow import arrow_util
-from tensorflow_data_validation.pyarrow_tf import pyarrow as pa
 from tensorflow_data_validation.statistics.generators import stats_generator
 from tensorflow_data_validation.statistics.generators import top_k_uniques_stats_generator
 from tensorflow_data_validation.utils import schema_util
@@ -47,24 +46,13 @@ def _make_feature_stats_proto(
     num_rank_histogram_buckets):
   """Makes a FeatureNameStatistics proto containing top-k and uniques stats."""
   # Create a FeatureNameStatistics proto that includes the unweighted top-k
-  # stats.
+  # stats and, if weights were provided, the weighted top-k stats.
   result = (
-      top_k_uniques_stats_generator.make_feature_stats_proto_with_topk_stats(
-          feature_path, value_count_list, is_categorical, False, num_top_values,
-          frequency_threshold, num_rank_histogram_buckets))
-
-  # If weights were provided, create another FeatureNameStatistics proto that
-  # includes the weighted top-k stats, and then copy those weighted top-k stats
-  # into the result proto.
-  if weighted_value_count_list:
-    weighted_result = (
-        top_k_uniques_stats_generator.make_feature_stats_proto_with_topk_stats(
-            feature_path, weighted_value_count_list, is_categorical, True,
-            num_top_values, weighted_frequency_threshold,
-            num_rank_histogram_buckets))
-
-    result.string_stats.weighted_string_stats.CopyFrom(
-        weighted_result.string_stats.weighted_string_stats)
+      top_k_uniques_stats_generator
+      .make_feature_stats_proto_with_topk_stats_combined(
+          feature_path, value_count_list, weighted_value_count_list,
+          is_categorical, num_top_values, frequency_threshold,
+          weighted_frequency_threshold, num_rank_histogram_buckets))
 
   # Add the number of uniques to the FeatureNameStatistics proto.
   result.string_stats.unique = len(value_count_list)
@@ -80,7 +68,7 @@ def _make_dataset_feature_stats_proto_with_multiple_features(
     num_rank_histogram_buckets):
   """Makes a DatasetFeatureStatistics proto containing multiple features."""
   result = statistics_pb2.DatasetFeatureStatistics()
-  for feature_path, value_count in six.iteritems(feature_names_to_value_counts):
+  for feature_path, value_count in feature_names_to_value_counts.items():
     if weighted_feature_names_to_value_counts:
       weighted_value_count = weighted_feature_names_to_value_counts[
           feature_path]
@@ -96,24 +84,6 @@ def _make_dataset_feature_stats_proto_with_multiple_features(
   return result
 
 
-class _WeightedCounter(collections.defaultdict):
-  """A counter that support weighted counts."""
-
-  def __init__(self):
-    super(_WeightedCounter, self).__init__(int)
-
-  def weighted_update(self, values,
-                      weights):
-    """Updates the count of elements in `values` with weights."""
-
-    for v, w in six.moves.zip(values, weights):
-      self[v] += w
-
-  def update(self, other):
-    for k, v in six.iteritems(other):
-      self[k] += v
-
-
 class TopKUniquesCombinerStatsGenerator(
     stats_generator.CombinerStatsGenerator):
   """Combiner statistics generator that computes top-k and uniques stats.
@@ -156,72 +126,96 @@ class TopKUniquesCombinerStatsGenerator(
     self._frequency_threshold = frequency_threshold
     self._weighted_frequency_threshold = weighted_frequency_threshold
     self._num_rank_histogram_buckets = num_rank_histogram_buckets
+    # Maps each feature name to the arrow type of the last column seen for it
+    # and the feature type derived from that arrow type. Column types rarely
+    # change between batches, so this saves the type dispatch in add_input.
+    self._feature_types = {}
+    # Maps each feature name to its FeaturePath, so that the paths used as
+    # accumulator keys are created once rather than once per batch.
+    self._feature_paths = {}
 
   def create_accumulator(self):
     return {}
 
-  # Implementation note:
-  # The current implementation loops over the flattened value ndarrays and
-  # weight ndarrays which is slow. We could have used np.unique() (or similar
-  # vectorized approach) but np.unique() involves a sort(), which is slow if
-  # dtype==np.object (for strings, which is our most common use case).
-  # However pandas allows us to group-by-and-count-and-sum without sorting.
-  # So one way to improve the performance would be, for each feature, to
-  # construct an Arrow Table that consists of flattend values and weights
-  # (zero copy here), then table.to_pandas() (one copy here, but unavoidable
-  # anyways), then use something like DataFrame.groupby().agg(['sum', 'count']).
-  # The accumulator could simply be a DataFrame for each feature, and make use
-  # of DataFrame merging provided by pandas.
+  def _get_feature_type(
+      self, feature_path,
+      arrow_type):
+    """Returns the feature type of a column, reusing earlier dispatches."""
+    feature_name = feature_path.steps()[0]
+    cached = self._feature_types.get(feature_name)
+    if cached is not None and cached[0].equals(arrow_type):
+      return cached[1]
+    feature_type = stats_util.get_feature_type_from_arrow_type(
+        feature_path, arrow_type)
+    self._feature_types[feature_name] = (arrow_type, feature_type)
+    return feature_type
+
   def add_input(self, accumulator,
                 input_table):
-    weight_column = (input_table.column(self._weight_feature)
-                     if self._weight_feature else None)
-    weight_array = weight_column.data.chunk(0) if weight_column else []
-    if weight_array:
-      flattened_weights = arrow_util.FlattenListArray(weight_array).to_numpy()
-
+    # The weights are only flattened once a feature that needs top-k stats is
+    # found, as tables may have no string or categorical features.
+    flattened_weights = None
     for column in input_table.columns:
       feature_name = column.name
       # Skip the weight feature.
       if feature_name == self._weight_feature:
         continue
-      feature_path = types.FeaturePath([feature_name])
-      feature_type = stats_util.get_feature_type_from_arrow_type(
-          feature_path, column.type)
+      feature_path = self._feature_paths.get(feature_name)
+      if feature_path is None:
+        feature_path = types.FeaturePath([feature_name])
+        self._feature_paths[feature_name] = feature_path
+      feature_type = self._get_feature_type(feature_path, column.type)
+      is_string_feature = (
+          feature_type == statistics_pb2.FeatureNameStatistics.STRING)
       # if it's not a categorical feature nor a string feature, we don't bother
       # with topk stats.
-      if not (feature_path in self._categorical_features or
-              feature_type == statistics_pb2.FeatureNameStatistics.STRING):
+      if not (is_string_feature or
+              feature_path in self._categorical_features):
         continue
-      value_array = column.data.chunk(0)
-      flattened_values = arrow_util.FlattenListArray(value_array)
-      unweighted_counts = collections.Counter()
-      # Compute unweighted counts.
-      value_counts = arrow_util.ValueCounts(flattened_values)
-      for value_count in value_counts:
-        value_count = value_count.as_py()
-        unweighted_counts[value_count['values']] = value_count['counts']
-
-      # Compute weighted counts if a weight feature is specified.
-      weighted_counts = _WeightedCounter()
-      if weight_array:
-        if (pa.types.is_binary(flattened_values.type) or
-            pa.types.is_string(flattened_values.type)):
-          # no free conversion.
-          flattened_values_np = flattened_values.to_pandas()
-        else:
-          flattened_values_np = flattened_values.to_numpy()
-        indices = arrow_util.GetFlattenedArrayParentIndices(value_array)
-        weighted_counts.weighted_update(flattened_values_np,
-                                        flattened_weights[indices.to_numpy()])
-
-      if feature_path not in accumulator:
-        accumulator[feature_path] = _ValueCounts(
-            unweighted_counts=unweighted_counts,
-            weighted_counts=weighted_counts)
-      else:
-        accumulator[feature_path].unweighted_counts.update(unweighted_counts)
-        accumulator[feature_path].weighted_counts.update(weighted_counts)
+      value_counts = accumulator.get(feature_path)
+      if value_counts is None:
+        value_counts = _ValueCounts(
+            unweighted_counts=collections.Counter(),
+            weighted_counts=collections.Counter())
+        accumulator[feature_path] = value_counts
+      if self._weight_feature and flattened_weights is None:
+        flattened_weights = np.concatenate([
+            arrow_util.FlattenListArray(weight_array).to_numpy()
+            for weight_array in input_table.column(
+                self._weight_feature).data.iterchunks()
+        ])
+
+      # The chunks of a column hold consecutive rows of the table. row_offset
+      # is the index of the first row of the current chunk, which is needed to
+      # align the values of the chunk with their weights.
+      row_offset = 0
+      for value_array in column.data.iterchunks():
+        flattened_values = arrow_util.FlattenListArray(value_array)
+        # Dictionary-encode the values and count the dictionary indices with
+        # numpy. The values are hashed once for both the unweighted and the
+        # weighted counts, and only the unique values are converted to Python
+        # objects.
+        encoded_values = flattened_values.dictionary_encode()
+        value_indices = encoded_values.indices.to_numpy()
+        unique_values = encoded_values.dictionary.to_pylist()
+        value_counts.unweighted_counts.update(dict(zip(
+            unique_values,
+            np.bincount(value_indices, minlength=len(unique_values)).tolist())))
+
+        # Compute weighted counts if a weight feature is specified.
+        if flattened_weights is not None:
+          # The weight of each example is repeated once per value of the
+          # example to line the weights up with the flattened values, which
+          # avoids gathering them through the parent indices.
+          weight_sums = np.bincount(
+              value_indices,
+              weights=np.repeat(
+                  flattened_weights[row_offset:row_offset + len(value_array)],
+                  arrow_util.ListLengthsFromListArray(value_array).to_numpy()),
+              minlength=len(unique_values))
+          value_counts.weighted_counts.update(dict(zip(
+              unique_values, weight_sums.tolist())))
+        row_offset += len(value_array)
     return accumulator
 
   def merge_accumulators(
@@ -229,14 +223,15 @@ class TopKUniquesCombinerStatsGenerator(
   ):
     result = {}
     for accumulator in accumulators:
-      for feature_path, value_counts in six.iteritems(accumulator):
-        if feature_path not in result:
+      for feature_path, value_counts in accumulator.items():
+        existing_value_counts = result.get(feature_path)
+        if existing_value_counts is None:
           result[feature_path] = value_counts
         else:
-          result[feature_path].unweighted_counts.update(
+          existing_value_counts.unweighted_counts.update(
               value_counts.unweighted_counts)
-          if result[feature_path].weighted_counts:
-            result[feature_path].weighted_counts.update(
+          if existing_value_counts.weighted_counts:
+            existing_value_counts.weighted_counts.update(
                 value_counts.weighted_counts)
     return result
 
@@ -247,16 +242,14 @@ class TopKUniquesCombinerStatsGenerator(
 
     for feature_path, value_counts in accumulator.items():
       if value_counts.unweighted_counts:
-        feature_value_counts = [
-            top_k_uniques_stats_generator.FeatureValueCount(key, value)
-            for key, value in value_counts.unweighted_counts.items()
-        ]
+        feature_value_counts = list(map(
+            top_k_uniques_stats_generator.FeatureValueCount._make,
+            value_counts.unweighted_counts.items()))
         feature_paths_to_value_counts[feature_path] = feature_value_counts
       if value_counts.weighted_counts:
-        weighted_feature_value_counts = [
-            top_k_uniques_stats_generator.FeatureValueCount(key, value)
-            for key, value in value_counts.weighted_counts.items()
-        ]
+        weighted_feature_value_counts = list(map(
+            top_k_uniques_stats_generator.FeatureValueCount._make,
+            value_counts.weighted_counts.items()))
         feature_paths_to_weighted_value_counts[
             feature_path] = weighted_feature_value_counts
 
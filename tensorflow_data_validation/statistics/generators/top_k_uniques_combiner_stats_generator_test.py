@@ -206,6 +206,88 @@ class TopKUniquesCombinerStatsGeneratorTest(
             weight_feature='w', num_top_values=4, num_rank_histogram_buckets=3))
     self.assertCombinerOutputEqual(batches, generator, expected_result)
 
+  def test_topk_uniques_combiner_with_weights_multiple_chunks(self):
+    # Concatenating the tables results in columns with two chunks each.
+    # non-weighted ordering
+    # 3 'b', 2 'a', 1 'c'
+    # weighted ordering
+    # 14 'b', 3 'c', 3 'a'
+    batches = [
+        pa.concat_tables([
+            pa.Table.from_arrays([
+                pa.array([['a', 'b'], ['a']]),
+                pa.array([[1.0], [2.0]]),
+            ], ['fa', 'w']),
+            pa.Table.from_arrays([
+                pa.array([['b'], ['c', 'b']]),
+                pa.array([[10.0], [3.0]]),
+            ], ['fa', 'w']),
+        ])
+    ]
+    expected_result = {
+        types.FeaturePath(['fa']):
+            text_format.Parse(
+                """
+                path {
+                  step: 'fa'
+                }
+                type: STRING
+                string_stats {
+                  unique: 3
+                  top_values {
+                    value: 'b'
+                    frequency: 3.0
+                  }
+                  top_values {
+                    value: 'a'
+                    frequency: 2.0
+                  }
+                  rank_histogram {
+                    buckets {
+                      low_rank: 0
+                      high_rank: 0
+                      label: "b"
+                      sample_count: 3.0
+                    }
+                    buckets {
+                      low_rank: 1
+                      high_rank: 1
+                      label: "a"
+                      sample_count: 2.0
+                    }
+                  }
+                  weighted_string_stats {
+                    top_values {
+                      value: 'b'
+                      frequency: 14.0
+                    }
+                    top_values {
+                      value: 'c'
+                      frequency: 3.0
+                    }
+                    rank_histogram {
+                      buckets {
+                        low_rank: 0
+                        high_rank: 0
+                        label: "b"
+                        sample_count: 14.0
+                      }
+                      buckets {
+                        low_rank: 1
+                        high_rank: 1
+                        label: "c"
+                        sample_count: 3.0
+                      }
+                    }
+                  }
+              }""", statistics_pb2.FeatureNameStatistics())
+    }
+    generator = (
+        top_k_uniques_combiner_stats_generator
+        .TopKUniquesCombinerStatsGenerator(
+            weight_feature='w', num_top_values=2, num_rank_histogram_buckets=2))
+    self.assertCombinerOutputEqual(batches, generator, expected_result)
+
   def test_topk_uniques_combiner_with_single_unicode_feature(self):
     # fa: 4 'a', 2 'b', 3 'c', 2 'd', 1 'e'
     batches = [
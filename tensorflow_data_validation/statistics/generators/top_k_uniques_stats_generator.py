@@ -23,10 +23,10 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import heapq
 import logging
 import apache_beam as beam
 import numpy as np
-import pandas as pd
 import six
 from tensorflow_data_validation import types
 from tensorflow_data_validation.arrow import arrow_util
@@ -53,7 +53,7 @@ def _make_feature_stats_proto_with_uniques_stats(
     is_categorical):
   """Makes a FeatureNameStatistics proto containing the uniques stats."""
   result = statistics_pb2.FeatureNameStatistics()
-  result.path.CopyFrom(feature_path.to_proto())
+  result.path.step.extend(feature_path.steps())
   # If we have a categorical feature, we preserve the type to be the original
   # INT type.
   result.type = (
@@ -73,8 +73,67 @@ def _make_dataset_feature_stats_proto_with_uniques_for_single_feature(
   result = statistics_pb2.DatasetFeatureStatistics()
   result.features.add().CopyFrom(
       _make_feature_stats_proto_with_uniques_stats(
-          feature_path, count, feature_path in categorical_features))
-  return slice_key, result.SerializeToString()
+          feature_path, count, feature_path_tuple in categorical_features))
+  return slice_key, result
+
+
+def _populate_topk_string_stats(
+    string_stats,
+    feature_path,
+    top_k_value_count_list, num_top_values,
+    frequency_threshold,
+    num_rank_histogram_buckets):
+  """Populates the top values and rank histogram of a string_stats proto."""
+  # Select the most frequent values that meet the frequency threshold in
+  # descending order by count. Where multiple feature values have the same
+  # count, consider the feature with the 'larger' feature value to be larger for
+  # purposes of breaking the tie. Only the values that can be output are
+  # selected, which avoids sorting all the values of high cardinality features.
+  top_k_value_count_list = heapq.nlargest(
+      max(num_top_values, num_rank_histogram_buckets),
+      (value_count for value_count in top_k_value_count_list
+       if value_count[1] >= frequency_threshold),
+      key=lambda counts: (counts[1], counts[0]))
+
+  labels_and_counts = []
+  for value, count in top_k_value_count_list:
+    # Check if we have a valid utf-8 string. If not, assign a default invalid
+    # string value.
+    if isinstance(value, bytes):
+      label = maybe_get_utf8(value)
+      if label is None:
+        logging.warning('Feature "%s" has bytes value "%s" which cannot be '
+                        'decoded as a UTF-8 string.', feature_path, value)
+        label = _INVALID_STRING
+    elif isinstance(value, six.text_type):
+      label = value
+    else:
+      label = str(value)
+    labels_and_counts.append((label, count))
+
+  # Build the repeated fields in one extend call each rather than adding and
+  # then populating one message at a time.
+  string_stats.top_values.extend(
+      statistics_pb2.StringStatistics.FreqAndValue(value=label, frequency=count)
+      for label, count in labels_and_counts[:num_top_values])
+  string_stats.rank_histogram.buckets.extend(
+      statistics_pb2.RankHistogram.Bucket(
+          low_rank=i, high_rank=i, sample_count=count, label=label)
+      for i, (label, count) in enumerate(
+          labels_and_counts[:num_rank_histogram_buckets]))
+
+
+def _make_feature_stats_proto(
+    feature_path,
+    is_categorical):
+  """Makes an empty FeatureNameStatistics proto for a top-k feature."""
+  result = statistics_pb2.FeatureNameStatistics()
+  result.path.step.extend(feature_path.steps())
+  # If we have a categorical feature, we preserve the type to be the original
+  # INT type.
+  result.type = (statistics_pb2.FeatureNameStatistics.INT if is_categorical
+                 else statistics_pb2.FeatureNameStatistics.STRING)
+  return result
 
 
 def make_feature_stats_proto_with_topk_stats(
@@ -100,50 +159,55 @@ def make_feature_stats_proto_with_topk_stats(
   Returns:
     A FeatureNameStatistics proto containing the top-k stats.
   """
-  # Sort the top_k_value_count_list in descending order by count. Where
-  # multiple feature values have the same count, consider the feature with the
-  # 'larger' feature value to be larger for purposes of breaking the tie.
-  top_k_value_count_list.sort(
-      key=lambda counts: (counts[1], counts[0]),
-      reverse=True)
-
-  result = statistics_pb2.FeatureNameStatistics()
-  result.path.CopyFrom(feature_path.to_proto())
-  # If we have a categorical feature, we preserve the type to be the original
-  # INT type.
-  result.type = (statistics_pb2.FeatureNameStatistics.INT if is_categorical
-                 else statistics_pb2.FeatureNameStatistics.STRING)
-
+  result = _make_feature_stats_proto(feature_path, is_categorical)
   if is_weighted_stats:
     string_stats = result.string_stats.weighted_string_stats
   else:
     string_stats = result.string_stats
+  _populate_topk_string_stats(string_stats, feature_path,
+                              top_k_value_count_list, num_top_values,
+                              frequency_threshold, num_rank_histogram_buckets)
+  return result
 
-  for i in range(len(top_k_value_count_list)):
-    value, count = top_k_value_count_list[i]
-    if count < frequency_threshold:
-      break
-    # Check if we have a valid utf-8 string. If not, assign a default invalid
-    # string value.
-    if isinstance(value, six.binary_type):
-      value = maybe_get_utf8(value)
-      if value is None:
-        logging.warning('Feature "%s" has bytes value "%s" which cannot be '
-                        'decoded as a UTF-8 string.', feature_path, value)
-        value = _INVALID_STRING
-    elif not isinstance(value, six.text_type):
-      value = str(value)
-
-    if i < num_top_values:
-      freq_and_value = string_stats.top_values.add()
-      freq_and_value.value = value
-      freq_and_value.frequency = count
-    if i < num_rank_histogram_buckets:
-      bucket = string_stats.rank_histogram.buckets.add()
-      bucket.low_rank = i
-      bucket.high_rank = i
-      bucket.sample_count = count
-      bucket.label = value
+
+def make_feature_stats_proto_with_topk_stats_combined(
+    feature_path,
+    top_k_value_count_list,
+    weighted_top_k_value_count_list,
+    is_categorical, num_top_values,
+    frequency_threshold,
+    weighted_frequency_threshold,
+    num_rank_histogram_buckets):
+  """Makes a FeatureNameStatistics proto with unweighted and weighted top-k.
+
+  Args:
+    feature_path: The path of the feature.
+    top_k_value_count_list: A list of FeatureValueCount tuples.
+    weighted_top_k_value_count_list: An optional list of FeatureValueCount
+      tuples whose counts incorporate weights. If empty or None, no weighted
+      top-k stats are added.
+    is_categorical: Whether the feature is categorical.
+    num_top_values: The number of most frequent feature values to keep for
+      string features.
+    frequency_threshold: The minimum number of examples the most frequent
+      values must be present in.
+    weighted_frequency_threshold: The minimum weighted number of examples the
+      most frequent weighted values must be present in.
+    num_rank_histogram_buckets: The number of buckets in the rank histogram for
+      string features.
+
+  Returns:
+    A FeatureNameStatistics proto containing the top-k stats.
+  """
+  result = _make_feature_stats_proto(feature_path, is_categorical)
+  _populate_topk_string_stats(result.string_stats, feature_path,
+                              top_k_value_count_list, num_top_values,
+                              frequency_threshold, num_rank_histogram_buckets)
+  if weighted_top_k_value_count_list:
+    _populate_topk_string_stats(
+        result.string_stats.weighted_string_stats, feature_path,
+        weighted_top_k_value_count_list, num_top_values,
+        weighted_frequency_threshold, num_rank_histogram_buckets)
   return result
 
 
@@ -159,10 +223,11 @@ def _make_dataset_feature_stats_proto_with_topk_for_single_feature(
   result = statistics_pb2.DatasetFeatureStatistics()
   result.features.add().CopyFrom(
       make_feature_stats_proto_with_topk_stats(
-          feature_path, value_count_list, feature_path in categorical_features,
+          feature_path, value_count_list,
+          feature_path_tuple in categorical_features,
           is_weighted_stats, num_top_values, frequency_threshold,
           num_rank_histogram_buckets))
-  return slice_key, result.SerializeToString()
+  return slice_key, result
 
 
 def _weighted_unique(values, weights
@@ -170,72 +235,200 @@ def _weighted_unique(values, weights
   """Computes weighted uniques.
 
   Args:
-    values: 1-D array.
-    weights: 1-D numeric array. Should have the same size as `values`.
+    values: A flattened arrow array of values.
+    weights: 1-D numeric numpy array. Should have the same size as `values`.
   Returns:
     An iterator of tuples (unique_value, count, sum_weight).
 
-  Implementation note: we use Pandas and pay the cost of copying the
-  input numpy arrays into a DataFrame because Pandas can perform group-by
-  without sorting. A numpy-only implementation with sorting is possible but
-  slower because of the calls to the string comparator.
+  Implementation note: the values are dictionary-encoded and the counts and
+  weights are summed per dictionary index with numpy, so only the unique values
+  are converted to Python objects.
   """
-  df = pd.DataFrame({
-      'value': values,
-      'count': np.ones_like(values, dtype=np.int32),
-      'weight': weights,
-  })
-  gb = df.groupby(
-      'value', as_index=False, sort=False)['count', 'weight'].sum()
-  return six.moves.zip(
-      gb['value'].tolist(), gb['count'].tolist(), gb['weight'].tolist())
+  encoded_values = values.dictionary_encode()
+  unique_values = encoded_values.dictionary.to_pylist()
+  indices = encoded_values.indices.to_numpy()
+  counts = np.bincount(indices, minlength=len(unique_values))
+  weight_sums = np.bincount(
+      indices, weights=weights, minlength=len(unique_values))
+  return zip(unique_values, counts.tolist(), weight_sums.tolist())
 
 
-def _to_topk_tuples(
-    sliced_table,
+def _get_topk_columns(
+    table,
     categorical_features,
-    weight_feature = None
+    weight_feature
 ):
-  """Generates tuples for computing top-k and uniques from input tables."""
-  slice_key, table = sliced_table
-  weight_column = table.column(weight_feature) if weight_feature else None
-  weight_array = weight_column.data.chunk(0) if weight_column else []
-  if weight_array:
-    flattened_weights = arrow_util.FlattenListArray(weight_array).to_numpy()
-
+  """Yields the path tuple and column of each feature that needs top-k stats."""
   for feature_column in table.columns:
     feature_name = feature_column.name
     # Skip the weight feature.
     if feature_name == weight_feature:
       continue
-    feature_path = types.FeaturePath([feature_name])
+    feature_path_tuple = (feature_name,)
     # if it's not a categorical feature nor a string feature, we don't bother
     # with topk stats.
-    if not (feature_path in categorical_features or
+    if not (feature_path_tuple in categorical_features or
             feature_column.type.equals(pa.list_(pa.binary())) or
             feature_column.type.equals(pa.list_(pa.string()))):
       continue
-    value_array = feature_column.data.chunk(0)
-    flattened_values = arrow_util.FlattenListArray(value_array)
-
-    if weight_array and flattened_values:
-      if (pa.types.is_binary(flattened_values.type) or
-          pa.types.is_string(flattened_values.type)):
-        # no free conversion.
-        flattened_values_np = flattened_values.to_pandas()
-      else:
-        flattened_values_np = flattened_values.to_numpy()
-      indices = arrow_util.GetFlattenedArrayParentIndices(value_array)
-      weights_ndarray = flattened_weights[indices.to_numpy()]
-      for value, count, weight in _weighted_unique(
-          flattened_values_np, weights_ndarray):
-        yield (slice_key, feature_path.steps(), value), (count, weight)
+    yield feature_path_tuple, feature_column
+
+
+def _to_topk_tuples(
+    sliced_table,
+    categorical_features
+):
+  """Generates tuples for computing top-k and uniques from input tables."""
+  slice_key, table = sliced_table
+  for feature_path_tuple, feature_column in _get_topk_columns(
+      table, categorical_features, None):
+    for value_array in feature_column.data.iterchunks():
+      flattened_values = arrow_util.FlattenListArray(value_array)
+      if not flattened_values:
+        continue
+      # Count the dictionary indices of the values with numpy, so that only
+      # the unique values are converted to Python objects.
+      encoded_values = flattened_values.dictionary_encode()
+      values = encoded_values.dictionary.to_pylist()
+      counts = np.bincount(
+          encoded_values.indices.to_numpy(), minlength=len(values)).tolist()
+      for value, count in zip(values, counts):
+        yield ((slice_key, feature_path_tuple, value), count)
+
+
+def _to_weighted_topk_tuples(
+    sliced_table,
+    categorical_features,
+    weight_feature
+):
+  """Generates tuples for computing weighted top-k and uniques from tables."""
+  slice_key, table = sliced_table
+  flattened_weights = np.concatenate([
+      arrow_util.FlattenListArray(weight_array).to_numpy()
+      for weight_array in table.column(weight_feature).data.iterchunks()
+  ])
+  for feature_path_tuple, feature_column in _get_topk_columns(
+      table, categorical_features, weight_feature):
+    # The chunks of a column hold consecutive rows of the table. row_offset is
+    # the index of the first row of the current chunk, which is needed to align
+    # the values of the chunk with their weights.
+    row_offset = 0
+    for value_array in feature_column.data.iterchunks():
+      flattened_values = arrow_util.FlattenListArray(value_array)
+      if flattened_values:
+        # The weight of each example is repeated once per value of the example
+        # to line the weights up with the flattened values.
+        weights_ndarray = np.repeat(
+            flattened_weights[row_offset:row_offset + len(value_array)],
+            arrow_util.ListLengthsFromListArray(value_array).to_numpy())
+        for value, count, weight in _weighted_unique(
+            flattened_values, weights_ndarray):
+          yield (slice_key, feature_path_tuple, value), (count, weight)
+      row_offset += len(value_array)
+
+
+class _SumCountsAndWeightsCombineFn(beam.CombineFn):
+  """Computes the sums of (count, weight) pairs."""
+
+  def create_accumulator(self):
+    return [0, 0.0]
+
+  def add_input(self, accumulator,
+                count_and_weight):
+    accumulator[0] += count_and_weight[0]
+    accumulator[1] += count_and_weight[1]
+    return accumulator
+
+  def merge_accumulators(
+      self, accumulators):
+    result = [0, 0.0]
+    for count, weight in accumulators:
+      result[0] += count
+      result[1] += weight
+    return result
+
+  def extract_output(self, accumulator
+                    ):
+    return accumulator[0], accumulator[1]
+
+
+def _push_to_heap(heap, k, item):
+  """Pushes item to a min-heap that keeps the k largest items."""
+  if len(heap) < k:
+    heapq.heappush(heap, item)
+  elif item > heap[0]:
+    heapq.heapreplace(heap, item)
+
+
+class _TopKUniquesCombineFn(beam.CombineFn):
+  """Computes the top-k values and the number of uniques of a feature.
+
+  Each input holds the total count of one unique value of the feature, either
+  as (value, count) or, if weighted, as (value, (count, weight)). The
+  accumulator is [top_k, num_uniques, weighted_top_k], where top_k and
+  weighted_top_k are min-heaps of at most k (count, value) pairs. Where
+  multiple values have the same count, the 'larger' value is considered larger.
+  """
+
+  def __init__(self, k, weighted):
+    self._k = k
+    self._weighted = weighted
+
+  def create_accumulator(self):
+    return [[], 0, []]
+
+  def add_input(self, accumulator,
+                value_and_counts):
+    value, counts = value_and_counts
+    accumulator[1] += 1
+    if self._weighted:
+      count, weight = counts
+      _push_to_heap(accumulator[2], self._k, (weight, value))
     else:
-      value_counts = arrow_util.ValueCounts(flattened_values)
-      values = value_counts.field('values').to_pylist()
-      counts = value_counts.field('counts').to_pylist()
-      for value, count in six.moves.zip(values, counts):
-        yield ((slice_key, feature_path.steps(), value), count)
+      count = counts
+    _push_to_heap(accumulator[0], self._k, (count, value))
+    return accumulator
+
+  def merge_accumulators(self, accumulators
+                        ):
+    result = self.create_accumulator()
+    for top_k, num_uniques, weighted_top_k in accumulators:
+      result[1] += num_uniques
+      for count_and_value in top_k:
+        _push_to_heap(result[0], self._k, count_and_value)
+      for weight_and_value in weighted_top_k:
+        _push_to_heap(result[2], self._k, weight_and_value)
+    return result
+
+  def extract_output(
+      self, accumulator
+  ):
+    top_k, num_uniques, weighted_top_k = accumulator
+    return ([(value, count) for count, value in sorted(top_k, reverse=True)],
+            num_uniques,
+            [(value, weight)
+             for weight, value in sorted(weighted_top_k, reverse=True)])
+
+
+def _make_dataset_feature_stats_protos_for_single_feature(
+    feature_path_to_top_k_and_uniques,
+    categorical_features, is_weighted,
+    num_top_values, frequency_threshold,
+    weighted_frequency_threshold,
+    num_rank_histogram_buckets
+):
+  """Makes the top-k, uniques and weighted top-k protos for a feature."""
+  key, (top_k, num_uniques, weighted_top_k) = (
+      feature_path_to_top_k_and_uniques)
+  yield _make_dataset_feature_stats_proto_with_topk_for_single_feature(
+      (key, top_k), categorical_features, False, num_top_values,
+      frequency_threshold, num_rank_histogram_buckets)
+  yield _make_dataset_feature_stats_proto_with_uniques_for_single_feature(
+      (key, num_uniques), categorical_features)
+  if is_weighted:
+    yield _make_dataset_feature_stats_proto_with_topk_for_single_feature(
+        (key, weighted_top_k), categorical_features, True, num_top_values,
+        weighted_frequency_threshold, num_rank_histogram_buckets)
 
 
 class _ComputeTopKUniquesStats(beam.PTransform):
@@ -260,8 +453,12 @@ class _ComputeTopKUniquesStats(beam.PTransform):
       num_rank_histogram_buckets: The number of buckets in the rank histogram
           for string features.
     """
-    self._categorical_features = set(
-        schema_util.get_categorical_numeric_features(schema) if schema else [])
+    # The categorical features are kept as path tuples, which are cheaper to
+    # hash and pickle than FeaturePaths.
+    self._categorical_features = frozenset(
+        feature_path.steps() for feature_path in (
+            schema_util.get_categorical_numeric_features(schema)
+            if schema else []))
     self._weight_feature = weight_feature
     self._num_top_values = num_top_values
     self._frequency_threshold = frequency_threshold
@@ -269,91 +466,42 @@ class _ComputeTopKUniquesStats(beam.PTransform):
     self._num_rank_histogram_buckets = num_rank_histogram_buckets
 
   def expand(self, pcoll):
-
-    def _sum_pairwise(
-        iter_of_pairs
-    ):
-      """Computes sum of counts and weights."""
-      # We take advantage of the fact that constructing a np array from a list
-      # is much faster as the length is known beforehand.
-      if isinstance(iter_of_pairs, list):
-        arr = np.array(
-            iter_of_pairs, dtype=[('c', np.int64), ('w', np.float)])
-      else:
-        arr = np.fromiter(
-            iter_of_pairs, dtype=[('c', np.int64), ('w', np.float)])
-      return arr['c'].sum(), arr['w'].sum()
-
-    if self._weight_feature is not None:
-      sum_fn = _sum_pairwise
+    is_weighted = self._weight_feature is not None
+    # The weight handling is decided once here rather than for each table.
+    if is_weighted:
+      to_topk_tuples = beam.FlatMap(
+          _to_weighted_topk_tuples,
+          categorical_features=self._categorical_features,
+          weight_feature=self._weight_feature)
+      sum_fn = _SumCountsAndWeightsCombineFn()
     else:
+      to_topk_tuples = beam.FlatMap(
+          _to_topk_tuples, categorical_features=self._categorical_features)
       # For non-weighted case, use sum combine fn over integers to allow Beam
       # to use Cython combiner.
       sum_fn = sum
     top_k_tuples_combined = (
         pcoll
-        | 'ToTopKTuples' >> beam.FlatMap(
-            _to_topk_tuples,
-            categorical_features=self._categorical_features,
-            weight_feature=self._weight_feature)
+        | 'ToTopKTuples' >> to_topk_tuples
         | 'CombineCountsAndWeights' >> beam.CombinePerKey(sum_fn))
 
-    top_k = top_k_tuples_combined
-    if self._weight_feature is not None:
-      top_k |= 'Unweighted_DropWeights' >> beam.Map(lambda x: (x[0], x[1][0]))
-    # (slice_key, feature, v), c
-    top_k |= (
-        'Unweighted_Prepare' >>
-        beam.Map(lambda x: ((x[0][0], x[0][1]), (x[0][2], x[1])))
-        # (slice_key, feature), (v, c)
-        | 'Unweighted_TopK' >> beam.combiners.Top().PerKey(
-            max(self._num_top_values, self._num_rank_histogram_buckets),
-            key=lambda x: (x[1], x[0]))
-        | 'Unweighted_ToProto' >> beam.Map(
-            _make_dataset_feature_stats_proto_with_topk_for_single_feature,
+    # (slice_key, feature, v), c or (slice_key, feature, v), (c, w)
+    return (
+        top_k_tuples_combined
+        | 'Prepare' >> beam.Map(lambda x: ((x[0][0], x[0][1]), (x[0][2], x[1])))
+        # (slice_key, feature), (v, c) or (slice_key, feature), (v, (c, w))
+        | 'TopKAndUniques' >> beam.CombinePerKey(
+            _TopKUniquesCombineFn(
+                max(self._num_top_values, self._num_rank_histogram_buckets),
+                is_weighted))
+        | 'ToProtos' >> beam.FlatMap(
+            _make_dataset_feature_stats_protos_for_single_feature,
             categorical_features=self._categorical_features,
-            is_weighted_stats=False,
+            is_weighted=is_weighted,
             num_top_values=self._num_top_values,
             frequency_threshold=self._frequency_threshold,
+            weighted_frequency_threshold=self._weighted_frequency_threshold,
             num_rank_histogram_buckets=self._num_rank_histogram_buckets))
-    uniques = (
-        top_k_tuples_combined
-        | 'Uniques_DropValues' >> beam.Map(lambda x: (x[0][0], x[0][1]))
-        | 'Uniques_CountPerFeatureName' >> beam.combiners.Count().PerElement()
-        | 'Uniques_ConvertToSingleFeatureStats' >> beam.Map(
-            _make_dataset_feature_stats_proto_with_uniques_for_single_feature,
-            categorical_features=self._categorical_features))
-    result_protos = [top_k, uniques]
-
-    if self._weight_feature is not None:
-      weighted_top_k = (
-          top_k_tuples_combined
-          | 'Weighted_DropCounts' >> beam.Map(lambda x: (x[0], x[1][1]))
-          | 'Weighted_Prepare' >>
-          # (slice_key, feature), (v, w)
-          beam.Map(lambda x: ((x[0][0], x[0][1]), (x[0][2], x[1])))
-          | 'Weighted_TopK' >> beam.combiners.Top().PerKey(
-              max(self._num_top_values, self._num_rank_histogram_buckets),
-              key=lambda x: (x[1], x[0]))
-          | 'Weighted_ToProto' >> beam.Map(
-              _make_dataset_feature_stats_proto_with_topk_for_single_feature,
-              categorical_features=self._categorical_features,
-              is_weighted_stats=True,
-              num_top_values=self._num_top_values,
-              frequency_threshold=self._weighted_frequency_threshold,
-              num_rank_histogram_buckets=self._num_rank_histogram_buckets))
-      result_protos.append(weighted_top_k)
-
-    def _deserialize_sliced_feature_stats_proto(entry):
-      feature_stats_proto = statistics_pb2.DatasetFeatureStatistics()
-      feature_stats_proto.ParseFromString(entry[1])
-      return entry[0], feature_stats_proto
-    return (result_protos
-            | 'FlattenTopKUniquesFeatureStatsProtos' >> beam.Flatten()
-            # TODO(b/121152126): This deserialization stage is a workaround.
-            # Remove this once it is no longer needed.
-            | 'DeserializeTopKUniquesFeatureStatsProto' >>
-            beam.Map(_deserialize_sliced_feature_stats_proto))
 
 
 class TopKUniquesStatsGenerator(stats_generator.TransformStatsGenerator):
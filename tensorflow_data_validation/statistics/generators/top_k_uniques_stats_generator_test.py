@@ -229,6 +229,61 @@ class MakeFeatureStatsProtoWithTopKStatsTest(absltest.TestCase):
             top_k_value_count_list, False, True, 3, 1, 2))
     compare.assertProtoEqual(self, result, expected_result)
 
+  def test_make_feature_stats_proto_with_topk_stats_combined(self):
+    expected_result = text_format.Parse(
+        """
+        path {
+          step: 'fa'
+        }
+        type: STRING
+        string_stats {
+          top_values {
+            value: 'b'
+            frequency: 3
+          }
+          top_values {
+            value: 'a'
+            frequency: 2
+          }
+          rank_histogram {
+            buckets {
+              low_rank: 0
+              high_rank: 0
+              label: "b"
+              sample_count: 3.0
+            }
+          }
+          weighted_string_stats {
+            top_values {
+              value: 'a'
+              frequency: 4
+            }
+            rank_histogram {
+              buckets {
+                low_rank: 0
+                high_rank: 0
+                label: "a"
+                sample_count: 4.0
+              }
+            }
+          }
+    }""", statistics_pb2.FeatureNameStatistics())
+    top_k_value_count_list = [
+        top_k_uniques_stats_generator.FeatureValueCount('a', 2),
+        top_k_uniques_stats_generator.FeatureValueCount('b', 3),
+        top_k_uniques_stats_generator.FeatureValueCount('c', 1)
+    ]
+    weighted_top_k_value_count_list = [
+        top_k_uniques_stats_generator.FeatureValueCount('a', 4.0),
+        top_k_uniques_stats_generator.FeatureValueCount('b', 2.0)
+    ]
+    result = (
+        top_k_uniques_stats_generator
+        .make_feature_stats_proto_with_topk_stats_combined(
+            types.FeaturePath(['fa']), top_k_value_count_list,
+            weighted_top_k_value_count_list, False, 2, 2, 3.0, 1))
+    compare.assertProtoEqual(self, result, expected_result)
+
 
 class TopkUniquesStatsGeneratorTest(test_util.TransformStatsGeneratorTest):
   """Tests for TopkUniquesStatsGenerator."""
@@ -451,6 +506,114 @@ class TopkUniquesStatsGeneratorTest(test_util.TransformStatsGeneratorTest):
         add_default_slice_key_to_input=True,
         add_default_slice_key_to_output=True)
 
+  def test_topk_uniques_with_weights_multiple_chunks(self):
+    # Concatenating the tables results in columns with two chunks each.
+    # non-weighted ordering
+    # 3 'b', 2 'a', 1 'c'
+    # weighted ordering
+    # 14 'b', 3 'c', 3 'a'
+    examples = [
+        pa.concat_tables([
+            pa.Table.from_arrays([
+                pa.array([['a', 'b'], ['a']]),
+                pa.array([[1.0], [2.0]]),
+            ], ['fa', 'w']),
+            pa.Table.from_arrays([
+                pa.array([['b'], ['c', 'b']]),
+                pa.array([[10.0], [3.0]]),
+            ], ['fa', 'w']),
+        ])
+    ]
+
+    expected_result = [
+        text_format.Parse(
+            """
+            features {
+              path {
+                step: 'fa'
+              }
+              type: STRING
+              string_stats {
+                top_values {
+                  value: 'b'
+                  frequency: 3.0
+                }
+                top_values {
+                  value: 'a'
+                  frequency: 2.0
+                }
+                rank_histogram {
+                  buckets {
+                    low_rank: 0
+                    high_rank: 0
+                    label: "b"
+                    sample_count: 3.0
+                  }
+                  buckets {
+                    low_rank: 1
+                    high_rank: 1
+                    label: "a"
+                    sample_count: 2.0
+                  }
+                }
+              }
+            }""", statistics_pb2.DatasetFeatureStatistics()),
+        text_format.Parse(
+            """
+            features {
+              path {
+                step: 'fa'
+              }
+              type: STRING
+              string_stats {
+                weighted_string_stats {
+                  top_values {
+                    value: 'b'
+                    frequency: 14.0
+                  }
+                  top_values {
+                    value: 'c'
+                    frequency: 3.0
+                  }
+                  rank_histogram {
+                    buckets {
+                      low_rank: 0
+                      high_rank: 0
+                      label: "b"
+                      sample_count: 14.0
+                    }
+                    buckets {
+                      low_rank: 1
+                      high_rank: 1
+                      label: "c"
+                      sample_count: 3.0
+                    }
+                  }
+                }
+              }
+        }""", statistics_pb2.DatasetFeatureStatistics()),
+        text_format.Parse(
+            """
+      features {
+        path {
+          step: 'fa'
+        }
+        type: STRING
+        string_stats {
+          unique: 3
+        }
+      }""", statistics_pb2.DatasetFeatureStatistics()),
+    ]
+
+    generator = top_k_uniques_stats_generator.TopKUniquesStatsGenerator(
+        weight_feature='w', num_top_values=2, num_rank_histogram_buckets=2)
+    self.assertSlicingAwareTransformOutputEqual(
+        examples,
+        generator,
+        expected_result,
+        add_default_slice_key_to_input=True,
+        add_default_slice_key_to_output=True)
+
   def test_topk_uniques_with_single_unicode_feature(self):
     # fa: 4 'a', 2 'b', 3 'c', 2 'd', 1 'e'
     examples = [
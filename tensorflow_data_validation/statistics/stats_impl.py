@@ -21,10 +21,10 @@ from __future__ import print_function
 
 import itertools
 import random
+import time
 
 import apache_beam as beam
 import numpy as np
-import six
 from six.moves import zip
 from tensorflow_data_validation import constants
 from tensorflow_data_validation import types
@@ -128,14 +128,17 @@ class GenerateSlicedStatisticsImpl(beam.PTransform):
                         'found object of type %s' %
                         generator.__class__.__name__)
     if combiner_stats_generators:
-      # TODO(b/115685296): Obviate the need for the fanout=8 workaround.
+      # TODO(b/115685296): Obviate the need for the hot key fanout workaround.
+      # The fanout is either a constant or a function of the slice key, so that
+      # heavy slices can be spread over more intermediate combiners.
       result_protos.append(dataset
                            | 'RunCombinerStatsGenerators'
                            >> beam.CombinePerKey(
                                _CombinerStatsGeneratorsCombineFn(
                                    combiner_stats_generators,
                                    self._options.desired_batch_size
-                                   )).with_hot_key_fanout(fanout=8))
+                                   )).with_hot_key_fanout(
+                                       self._options.desired_hot_key_fanout))
 
     # result_protos is a list of PCollections of (slice key,
     # DatasetFeatureStatistics proto) pairs. We now flatten the list into a
@@ -146,12 +149,10 @@ class GenerateSlicedStatisticsImpl(beam.PTransform):
             | 'FlattenFeatureStatistics' >> beam.Flatten()
             | 'MergeDatasetFeatureStatisticsProtos' >>
             beam.CombinePerKey(_merge_dataset_feature_stats_protos)
-            | 'AddSliceKeyToStatsProto' >> beam.Map(
-                _add_slice_key,
-                self._is_slicing_enabled)
-            | 'ToList' >> beam.combiners.ToList()
             | 'MakeDatasetFeatureStatisticsListProto' >>
-            beam.Map(_make_dataset_feature_statistics_list_proto))
+            beam.CombineGlobally(
+                _MakeDatasetFeatureStatisticsListProtoCombineFn(
+                    self._is_slicing_enabled)))
 
 
 def get_generators(options,
@@ -269,23 +270,14 @@ def _filter_features(
     An Arrow table containing only the whitelisted features of the input table.
   """
   column_names = set(table.schema.names)
-  columns_to_select = []
-  for feature_name in feature_whitelist:
-    if feature_name in column_names:
-      columns_to_select.append(table.column(feature_name))
-  return pa.Table.from_arrays(columns_to_select)
-
-
-def _add_slice_key(
-    stats_proto_per_slice,
-    is_slicing_enabled
-):
-  """Add slice key to stats proto."""
-  result = statistics_pb2.DatasetFeatureStatistics()
-  result.CopyFrom(stats_proto_per_slice[1])
-  if is_slicing_enabled:
-    result.name = stats_proto_per_slice[0]
-  return result
+  feature_names = [feature_name for feature_name in feature_whitelist
+                   if feature_name in column_names]
+  # The table is returned as is if all its features are whitelisted, which
+  # avoids rebuilding it.
+  if column_names.issubset(feature_names):
+    return table
+  return pa.Table.from_arrays(
+      [table.column(feature_name) for feature_name in feature_names])
 
 
 def _merge_dataset_feature_stats_protos(
@@ -299,36 +291,33 @@ def _merge_dataset_feature_stats_protos(
   Returns:
     The merged DatasetFeatureStatistics proto.
   """
+  # Create a new DatasetFeatureStatistics proto.
+  result = statistics_pb2.DatasetFeatureStatistics()
   stats_per_feature = {}
   # Iterate over each DatasetFeatureStatistics proto and merge the
-  # FeatureNameStatistics protos per feature.
+  # FeatureNameStatistics protos per feature directly into the result proto.
   for stats_proto in stats_protos:
     for feature_stats_proto in stats_proto.features:
-      feature_path = types.FeaturePath.from_proto(feature_stats_proto.path)
-      if feature_path not in stats_per_feature:
-        stats_per_feature[feature_path] = feature_stats_proto
+      # The tuple of steps is only used as a key here, so no FeaturePath is
+      # created for it.
+      feature_path_key = tuple(feature_stats_proto.path.step)
+      stats_for_feature = stats_per_feature.get(feature_path_key)
+      if stats_for_feature is None:
+        stats_for_feature = result.features.add()
+        stats_for_feature.CopyFrom(feature_stats_proto)
+        stats_per_feature[feature_path_key] = stats_for_feature
       else:
-        stats_for_feature = stats_per_feature[feature_path]
         # MergeFrom would concatenate repeated fields which is not what we want
         # for path.step.
         del stats_for_feature.path.step[:]
-        stats_per_feature[feature_path].MergeFrom(feature_stats_proto)
+        stats_for_feature.MergeFrom(feature_stats_proto)
 
-  # Create a new DatasetFeatureStatistics proto.
-  result = statistics_pb2.DatasetFeatureStatistics()
   num_examples = None
-  for feature_stats_proto in six.itervalues(stats_per_feature):
-    # Add the merged FeatureNameStatistics proto for the feature
-    # into the DatasetFeatureStatistics proto.
-    new_feature_stats_proto = result.features.add()
-    new_feature_stats_proto.CopyFrom(feature_stats_proto)
-
+  for feature_stats_proto in result.features:
     # Get the number of examples from one of the features that
     # has common stats.
     if num_examples is None:
-      stats_type = feature_stats_proto.WhichOneof('stats')
-      stats_proto = None
-      if stats_type == 'num_stats':
+      if feature_stats_proto.HasField('num_stats'):
         stats_proto = feature_stats_proto.num_stats
       else:
         stats_proto = feature_stats_proto.string_stats
@@ -352,8 +341,7 @@ def _update_example_and_missing_count(
       dummy_feature, _WEIGHTED_NUM_EXAMPLES_KEY)
   stats.features.remove(dummy_feature)
   for feature_stats in stats.features:
-    common_stats = None
-    if feature_stats.WhichOneof('stats') == 'num_stats':
+    if feature_stats.HasField('num_stats'):
       common_stats = feature_stats.num_stats.common_stats
     else:
       common_stats = feature_stats.string_stats.common_stats
@@ -385,25 +373,96 @@ def _make_dataset_feature_statistics_list_proto(
   # Create a new DatasetFeatureStatisticsList proto.
   result = statistics_pb2.DatasetFeatureStatisticsList()
 
-  for stats_proto in stats_protos:
-    # Add the input DatasetFeatureStatistics proto.
-    new_stats_proto = result.datasets.add()
-    new_stats_proto.CopyFrom(stats_proto)
+  # Add the input DatasetFeatureStatistics protos.
+  result.datasets.extend(stats_protos)
+  for stats_proto in result.datasets:
     # We now update the example count for the dataset and the missing count
     # for all the features, using the number of examples computed separately
     # using NumExamplesStatsGenerator. Note that we compute the number of
     # examples separately to avoid ignoring example counts for features which
     # may be completely missing in a shard. We set the missing count of a
     # feature to be num_examples - non_missing_count.
-    _update_example_and_missing_count(new_stats_proto)
+    _update_example_and_missing_count(stats_proto)
   return result
 
 
+class _MakeDatasetFeatureStatisticsListProtoCombineFn(beam.CombineFn):
+  """Combines the per-slice stats protos into a DatasetFeatureStatisticsList.
+
+  The accumulator is a list of (slice key, DatasetFeatureStatistics proto)
+  pairs, so that each per-slice proto is copied only once, into the output
+  proto, where its slice key is added and its example and missing counts are
+  updated. The input protos are not modified.
+  """
+
+  def __init__(self, is_slicing_enabled):
+    self._is_slicing_enabled = is_slicing_enabled
+
+  def create_accumulator(self
+                        ):
+    return []
+
+  def add_input(
+      self,
+      accumulator,
+      stats_proto_per_slice
+  ):
+    accumulator.append(stats_proto_per_slice)
+    return accumulator
+
+  def merge_accumulators(
+      self,
+      accumulators
+  ):
+    # Only the first accumulator is modified, as allowed by beam.CombineFn.
+    accumulators = iter(accumulators)
+    result = next(accumulators)
+    for accumulator in accumulators:
+      result.extend(accumulator)
+    return result
+
+  def extract_output(
+      self,
+      accumulator
+  ):
+    result = statistics_pb2.DatasetFeatureStatisticsList()
+    for slice_key, stats_proto in accumulator:
+      new_stats_proto = result.datasets.add()
+      new_stats_proto.CopyFrom(stats_proto)
+      if self._is_slicing_enabled:
+        new_stats_proto.name = slice_key
+      # We now update the example count for the dataset and the missing count
+      # for all the features, using the number of examples computed separately
+      # using NumExamplesStatsGenerator.
+      _update_example_and_missing_count(new_stats_proto)
+    return result
+
+
 _DUMMY_FEATURE_PATH = types.FeaturePath(['__TFDV_INTERNAL_FEATURE__'])
 _NUM_EXAMPLES_KEY = '__NUM_EXAMPLES__'
 _WEIGHTED_NUM_EXAMPLES_KEY = '__WEIGHTED_NUM_EXAMPLES__'
 
 
+def _make_num_examples_stats_template():
+  """Makes the stats proto output by NumExamplesStatsGenerator, without counts.
+
+  Returns:
+    A DatasetFeatureStatistics proto containing the dummy feature with the
+    (unweighted and weighted) example count custom stats.
+  """
+  result = statistics_pb2.DatasetFeatureStatistics()
+  dummy_feature = result.features.add()
+  dummy_feature.path.CopyFrom(_DUMMY_FEATURE_PATH.to_proto())
+  dummy_feature.custom_stats.add(name=_NUM_EXAMPLES_KEY)
+  dummy_feature.custom_stats.add(name=_WEIGHTED_NUM_EXAMPLES_KEY)
+  return result
+
+
+# The output of NumExamplesStatsGenerator is copied from this proto, so that
+# the dummy feature is only built once.
+_NUM_EXAMPLES_STATS_TEMPLATE = _make_num_examples_stats_template()
+
+
 class NumExamplesStatsGenerator(stats_generator.CombinerStatsGenerator):
   """Computes total number of examples."""
 
@@ -426,25 +485,28 @@ class NumExamplesStatsGenerator(stats_generator.CombinerStatsGenerator):
 
   def merge_accumulators(self, accumulators
                         ):
-    result = self.create_accumulator()
-    for acc in accumulators:
-      result[0] += acc[0]
-      result[1] += acc[1]
-    return result
+    # Transpose the accumulators so that each count is summed by a single call
+    # to the builtin sum.
+    result = [sum(counts) for counts in zip(*accumulators)]
+    return result or self.create_accumulator()
 
   def extract_output(self, accumulator
                     ):
     result = statistics_pb2.DatasetFeatureStatistics()
-    dummy_feature = result.features.add()
-    dummy_feature.path.CopyFrom(_DUMMY_FEATURE_PATH.to_proto())
-    dummy_feature.custom_stats.add(name=_NUM_EXAMPLES_KEY, num=accumulator[0])
-    dummy_feature.custom_stats.add(name=_WEIGHTED_NUM_EXAMPLES_KEY,
-                                   num=accumulator[1])
+    result.CopyFrom(_NUM_EXAMPLES_STATS_TEMPLATE)
+    dummy_feature = result.features[0]
+    dummy_feature.custom_stats[0].num = accumulator[0]
+    dummy_feature.custom_stats[1].num = accumulator[1]
     beam.metrics.Metrics.counter(constants.METRICS_NAMESPACE, 'num_instances'
                                 ).inc(accumulator[0])
     return result
 
 
+# Clock used to time the batches of _CombinerStatsGeneratorsCombineFn. It is a
+# module attribute so that tests can replace it.
+_now = time.time
+
+
 class _CombinerStatsGeneratorsCombineFnAcc(object):
   """accumulator for _CombinerStatsGeneratorsCombineFn."""
 
@@ -492,19 +554,32 @@ class _CombinerStatsGeneratorsCombineFn(beam.CombineFn):
   # TODO(b/73789023): Ideally we should automatically infer the batch size.
   _DEFAULT_DESIRED_MERGE_ACCUMULATOR_BATCH_SIZE = 100
 
+  # Upper bound and target duration used when adapting the input batch size,
+  # in the same way as beam.BatchElements(). Input tables are never split, so
+  # adaptation only grows batches beyond the size of the decoded tables
+  # (DEFAULT_DESIRED_INPUT_BATCH_SIZE); a smaller batch size would have no
+  # effect.
+  _MAX_ADAPTIVE_BATCH_SIZE = 10000
+  _TARGET_BATCH_DURATION_SECS = 1.0
+  # Weight of the latest batch in the moving average of the time per example.
+  _SECS_PER_EXAMPLE_DECAY = 0.2
+
   def __init__(
       self,
       generators,
       desired_batch_size = None):
     self._generators = generators
 
-    # We really want the batch size to be adaptive like it is in
-    # beam.BatchElements(), but there isn't an easy way to make it so.
-    # TODO(b/73789023): Figure out how to make this batch size dynamic.
+    # If no batch size is provided, the batch size is grown after each batch
+    # so that processing a batch takes about _TARGET_BATCH_DURATION_SECS.
     if desired_batch_size and desired_batch_size > 0:
       self._desired_batch_size = desired_batch_size
+      self._adapt_batch_size = False
     else:
       self._desired_batch_size = constants.DEFAULT_DESIRED_INPUT_BATCH_SIZE
+      self._adapt_batch_size = True
+    # Moving average of the time spent per example in the generators.
+    self._secs_per_example = None
 
     # Metrics
     self._combine_add_input_batch_size = beam.metrics.Metrics.distribution(
@@ -518,23 +593,6 @@ class _CombinerStatsGeneratorsCombineFn(beam.CombineFn):
     self._num_compacts = beam.metrics.Metrics.counter(
         constants.METRICS_NAMESPACE, 'num_compacts')
 
-  def _for_each_generator(self,
-                          func,
-                          *args):
-    """Apply `func` for each wrapped generators.
-
-    Args:
-      func: a function that takes N + 1 arguments where N is the size of `args`.
-        the first argument is the stats generator.
-      *args: Iterables parallel to wrapped stats generators (i.e. the i-th item
-        corresponds to the self._generators[i]).
-    Returns:
-      A list whose i-th element is the result of
-      func(self._generators[i], args[0][i], args[1][i], ...).
-    """
-    return [func(gen, *args_for_func) for gen, args_for_func in zip(
-        self._generators, zip(*args))]
-
   def create_accumulator(self
                         ):  # pytype: disable=invalid-annotation
     return _CombinerStatsGeneratorsCombineFnAcc(
@@ -556,21 +614,65 @@ class _CombinerStatsGeneratorsCombineFn(beam.CombineFn):
     """
     batch_size = accumulator.curr_batch_size
     if (force and batch_size > 0) or batch_size >= self._desired_batch_size:
-      self._combine_add_input_batch_size.update(batch_size)
       if len(accumulator.input_tables) == 1:
         arrow_table = accumulator.input_tables[0]
       else:
         arrow_table = merge.MergeTables(accumulator.input_tables)
-      accumulator.partial_accumulators = self._for_each_generator(
-          lambda gen, gen_acc: gen.add_input(gen_acc, arrow_table),
-          accumulator.partial_accumulators)
       del accumulator.input_tables[:]
       accumulator.curr_batch_size = 0
+      self._do_batch(accumulator, arrow_table, force)
+
+  def _do_batch(
+      self,
+      accumulator,
+      arrow_table,
+      force = False):
+    """Does the stats computation for a batch and updates accumulator in place.
+
+    Args:
+      accumulator: Accumulator. Will be updated in place.
+      arrow_table: The batch of examples.
+      force: Whether the batch was flushed before reaching the batch size.
+    """
+    batch_size = arrow_table.num_rows
+    self._combine_add_input_batch_size.update(batch_size)
+    # Batches flushed early are usually small, and their fixed costs would
+    # skew the time per example, so only full batches are timed.
+    should_time_batch = self._adapt_batch_size and not force
+    if should_time_batch:
+      start_time = _now()
+    accumulator.partial_accumulators = [
+        gen.add_input(gen_acc, arrow_table) for gen, gen_acc in zip(
+            self._generators, accumulator.partial_accumulators)]
+    if should_time_batch:
+      self._update_desired_batch_size(batch_size, _now() - start_time)
+
+  def _update_desired_batch_size(self, batch_size,
+                                 elapsed_secs):
+    """Updates the desired batch size given the duration of the last batch."""
+    secs_per_example = elapsed_secs / batch_size
+    if self._secs_per_example is None:
+      self._secs_per_example = secs_per_example
+    else:
+      self._secs_per_example += self._SECS_PER_EXAMPLE_DECAY * (
+          secs_per_example - self._secs_per_example)
+    if self._secs_per_example <= 0:
+      return
+    self._desired_batch_size = int(min(
+        max(self._TARGET_BATCH_DURATION_SECS / self._secs_per_example,
+            constants.DEFAULT_DESIRED_INPUT_BATCH_SIZE),
+        self._MAX_ADAPTIVE_BATCH_SIZE))
 
   def add_input(
       self, accumulator,
       input_table
       ):
+    # A table that makes up a batch on its own is passed to the generators
+    # directly, without being queued.
+    if (not accumulator.input_tables and
+        input_table.num_rows >= self._desired_batch_size):
+      self._do_batch(accumulator, input_table)
+      return accumulator
     accumulator.input_tables.append(input_table)
     accumulator.curr_batch_size += input_table.num_rows
     self._maybe_do_batch(accumulator)
@@ -602,13 +704,14 @@ class _CombinerStatsGeneratorsCombineFn(beam.CombineFn):
         self._maybe_do_batch(result)
         batched_partial_accumulators.append(acc.partial_accumulators)
 
-      batched_accumulators_by_generator = list(
-          zip(*batched_partial_accumulators))
+      # zip(*...) transposes the partial accumulators in C, and is consumed
+      # lazily by the merge below.
+      batched_accumulators_by_generator = zip(*batched_partial_accumulators)
 
-      result.partial_accumulators = self._for_each_generator(
-          lambda gen, b, m: gen.merge_accumulators(itertools.chain((b,), m)),
-          result.partial_accumulators,
-          batched_accumulators_by_generator)
+      result.partial_accumulators = [
+          gen.merge_accumulators(itertools.chain((b,), m))
+          for gen, b, m in zip(self._generators, result.partial_accumulators,
+                               batched_accumulators_by_generator)]
 
     return result
 
@@ -628,8 +731,8 @@ class _CombinerStatsGeneratorsCombineFn(beam.CombineFn):
     # Make sure we have processed all the examples.
     self._maybe_do_batch(accumulator, force=True)
     return _merge_dataset_feature_stats_protos(
-        self._for_each_generator(lambda gen, acc: gen.extract_output(acc),
-                                 accumulator.partial_accumulators))
+        [gen.extract_output(gen_acc) for gen, gen_acc in zip(
+            self._generators, accumulator.partial_accumulators)])
 
 
 def generate_partial_statistics_in_memory(
@@ -650,9 +753,7 @@ def generate_partial_statistics_in_memory(
   result = []
 
   if options.feature_whitelist:
-    whitelisted_columns = [
-        table.column(f) for f in options.feature_whitelist]
-    table = pa.Table.from_arrays(whitelisted_columns)
+    table = _filter_features(table, options.feature_whitelist)
   for generator in stats_generators:
     result.append(
         generator.add_input(generator.create_accumulator(), table))
@@ -731,18 +832,6 @@ class CombinerFeatureStatsWrapperGenerator(
     self._weight_feature = weight_feature
     self._sample_rate = sample_rate
 
-  def _perhaps_initialize_for_feature_path(
-      self, wrapper_accumulator,
-      feature_path):
-    """Initializes the feature_path key if it does not exist."""
-    # Note: This manual initialization could have been avoided if
-    # wrapper_accumulator was a defaultdict, but this breaks pickling.
-    if feature_path not in wrapper_accumulator:
-      wrapper_accumulator[feature_path] = [
-          generator.create_accumulator()
-          for generator in self._feature_stats_generators
-      ]
-
   def create_accumulator(self):
     """Returns a fresh, empty wrapper_accumulator.
 
@@ -766,16 +855,29 @@ class CombinerFeatureStatsWrapperGenerator(
     """
     if self._sample_rate is not None and random.random() <= self._sample_rate:
       return wrapper_accumulator
+    # The generators and their add_input methods are looked up once per batch
+    # rather than once per feature.
+    feature_stats_generators = self._feature_stats_generators
+    add_input_fns = [
+        generator.add_input for generator in feature_stats_generators]
+    weight_feature = self._weight_feature
     for feature_column in input_table.itercolumns():
       feature_name = feature_column.name
-      if feature_name == self._weight_feature:
+      if feature_name == weight_feature:
         continue
       feature_path = types.FeaturePath([feature_name])
-      self._perhaps_initialize_for_feature_path(wrapper_accumulator,
-                                                feature_path)
-      for index, generator in enumerate(self._feature_stats_generators):
-        wrapper_accumulator[feature_path][index] = generator.add_input(
-            generator.create_accumulator(), feature_column)
+      accumulator_for_feature = wrapper_accumulator.get(feature_path)
+      # Note: This manual initialization could have been avoided if
+      # wrapper_accumulator was a defaultdict, but this breaks pickling.
+      if accumulator_for_feature is None:
+        accumulator_for_feature = [
+            generator.create_accumulator()
+            for generator in feature_stats_generators
+        ]
+        wrapper_accumulator[feature_path] = accumulator_for_feature
+      for index, add_input_fn in enumerate(add_input_fns):
+        accumulator_for_feature[index] = add_input_fn(
+            accumulator_for_feature[index], feature_column)
     return wrapper_accumulator
 
   def merge_accumulators(
@@ -789,14 +891,30 @@ class CombinerFeatureStatsWrapperGenerator(
     Returns:
       The merged accumulator.
     """
-    result = self.create_accumulator()
+    # Group the accumulators by feature and generator, so that each generator
+    # merges all the accumulators of a feature at once.
+    accumulators_per_feature = {}
     for wrapper_accumulator in wrapper_accumulators:
-      for feature_name, accumulator_for_feature in six.iteritems(
-          wrapper_accumulator):
-        self._perhaps_initialize_for_feature_path(result, feature_name)
-        for index, generator in enumerate(self._feature_stats_generators):
-          result[feature_name][index] = generator.merge_accumulators(
-              [result[feature_name][index], accumulator_for_feature[index]])
+      for feature_path, accumulator_for_feature in wrapper_accumulator.items():
+        accumulators_per_generator = accumulators_per_feature.get(feature_path)
+        if accumulators_per_generator is None:
+          accumulators_per_feature[feature_path] = [
+              [accumulator] for accumulator in accumulator_for_feature]
+        else:
+          for accumulators, accumulator in zip(accumulators_per_generator,
+                                               accumulator_for_feature):
+            accumulators.append(accumulator)
+
+    merge_accumulators_fns = [
+        generator.merge_accumulators
+        for generator in self._feature_stats_generators]
+    result = self.create_accumulator()
+    for feature_path, accumulators_per_generator in (
+        accumulators_per_feature.items()):
+      result[feature_path] = [
+          merge_accumulators_fn(accumulators)
+          for merge_accumulators_fn, accumulators in zip(
+              merge_accumulators_fns, accumulators_per_generator)]
     return result
 
   def extract_output(self, wrapper_accumulator
@@ -811,11 +929,13 @@ class CombinerFeatureStatsWrapperGenerator(
     """
     result = statistics_pb2.DatasetFeatureStatistics()
 
-    for feature_path, accumulator_for_feature in six.iteritems(
-        wrapper_accumulator):
+    extract_output_fns = [
+        generator.extract_output
+        for generator in self._feature_stats_generators]
+    for feature_path, accumulator_for_feature in wrapper_accumulator.items():
       feature_stats = result.features.add()
-      feature_stats.path.CopyFrom(feature_path.to_proto())
-      for index, generator in enumerate(self._feature_stats_generators):
-        feature_stats.MergeFrom(
-            generator.extract_output(accumulator_for_feature[index]))
+      feature_stats.path.step.extend(feature_path.steps())
+      for extract_output_fn, accumulator in zip(extract_output_fns,
+                                                accumulator_for_feature):
+        feature_stats.MergeFrom(extract_output_fn(accumulator))
     return result
@@ -22,6 +22,7 @@ from absl.testing import absltest
 from absl.testing import parameterized
 import apache_beam as beam
 from apache_beam.testing import util
+import mock
 import numpy as np
 from tensorflow_data_validation import types
 from tensorflow_data_validation.arrow import arrow_util
@@ -1624,6 +1625,64 @@ class StatsImplTest(parameterized.TestCase):
           test_util.make_dataset_feature_stats_list_proto_equal_fn(
               self, expected_result_with_slice_key))
 
+  def test_generate_sliced_statistics_impl_with_callable_hot_key_fanout(self):
+    sliced_tables = [
+        ('test_slice', pa.Table.from_arrays([
+            pa.array([[]], type=pa.list_(pa.float32()))], ['b'])
+        ),
+        ('test_slice', pa.Table.from_arrays([
+            pa.array([[]], type=pa.list_(pa.float32()))], ['b'])
+        ),
+    ]
+    fanout_fn = lambda slice_key: 2
+    options = stats_options.StatsOptions(
+        num_top_values=2,
+        num_rank_histogram_buckets=2,
+        num_values_histogram_buckets=2,
+        desired_hot_key_fanout=fanout_fn)
+    expected_result = text_format.Parse(
+        """
+        datasets {
+          name: "test_slice"
+          num_examples: 2
+          features {
+            path {
+              step: "b"
+            }
+            type: FLOAT
+            num_stats {
+              common_stats {
+                num_non_missing: 2
+                num_values_histogram {
+                  buckets {
+                    sample_count: 1.0
+                  }
+                  buckets {
+                    sample_count: 1.0
+                  }
+                  type: QUANTILES
+                }
+              }
+            }
+          }
+        }""", statistics_pb2.DatasetFeatureStatisticsList())
+    with_hot_key_fanout = beam.CombinePerKey.with_hot_key_fanout
+    with mock.patch.object(
+        beam.CombinePerKey, 'with_hot_key_fanout', autospec=True,
+        side_effect=with_hot_key_fanout) as mock_with_hot_key_fanout:
+      with beam.Pipeline() as p:
+        result = (
+            p | beam.Create(sliced_tables)
+            | stats_impl.GenerateSlicedStatisticsImpl(
+                options=options, is_slicing_enabled=True))
+        # The callable fanout must not change the combined statistics.
+        util.assert_that(
+            result,
+            test_util.make_dataset_feature_stats_list_proto_equal_fn(
+                self, expected_result))
+    # The callable is passed through to Beam unchanged.
+    mock_with_hot_key_fanout.assert_called_once_with(mock.ANY, fanout_fn)
+
   @parameterized.named_parameters(*GENERATE_STATS_TESTS)
   def test_generate_statistics_in_memory(
       self, tables, options, expected_result_proto_text, schema=None):
@@ -2096,6 +2155,67 @@ class StatsImplTest(parameterized.TestCase):
       self.assertEqual(actual_counter[0].committed,
                        expected_result[counter_name])
 
+  @mock.patch.object(stats_impl, '_now')
+  def test_combiner_stats_generators_combine_fn_adapts_batch_size(
+      self, mock_now):
+    table = pa.Table.from_arrays([pa.array([[1]] * 1000)], ['a'])
+    # The batch of 1000 examples takes 0.25 seconds, so the batch size is grown
+    # to the number of examples that can be processed in 1 second.
+    mock_now.side_effect = [0.0, 0.25]
+    combine_fn = stats_impl._CombinerStatsGeneratorsCombineFn(
+        [stats_impl.NumExamplesStatsGenerator()])
+    combine_fn.add_input(combine_fn.create_accumulator(), table)
+    self.assertEqual(combine_fn._desired_batch_size, 4000)
+
+  @mock.patch.object(stats_impl, '_now')
+  def test_combiner_stats_generators_combine_fn_does_not_shrink_batch_size(
+      self, mock_now):
+    table = pa.Table.from_arrays([pa.array([[1]] * 1000)], ['a'])
+    # Input tables are not split, so a slow batch does not reduce the batch
+    # size below the size of the decoded tables.
+    mock_now.side_effect = [0.0, 2.0]
+    combine_fn = stats_impl._CombinerStatsGeneratorsCombineFn(
+        [stats_impl.NumExamplesStatsGenerator()])
+    combine_fn.add_input(combine_fn.create_accumulator(), table)
+    self.assertEqual(combine_fn._desired_batch_size, 1000)
+
+  @mock.patch.object(stats_impl, '_now')
+  def test_combiner_stats_generators_combine_fn_fixed_batch_size(
+      self, mock_now):
+    table = pa.Table.from_arrays([pa.array([[1]] * 1000)], ['a'])
+    combine_fn = stats_impl._CombinerStatsGeneratorsCombineFn(
+        [stats_impl.NumExamplesStatsGenerator()], desired_batch_size=1000)
+    combine_fn.add_input(combine_fn.create_accumulator(), table)
+    self.assertEqual(combine_fn._desired_batch_size, 1000)
+    # Batches are not timed when the batch size is fixed.
+    mock_now.assert_not_called()
+
+  def test_combiner_feature_stats_wrapper_generator_add_input(self):
+    generator = stats_impl.CombinerFeatureStatsWrapperGenerator(
+        [_ValueCounter(), _ExampleCounter()])
+    accumulator = generator.create_accumulator()
+    accumulator = generator.add_input(
+        accumulator, pa.Table.from_arrays([pa.array([[1, 2], None])], ['a']))
+    accumulator = generator.add_input(
+        accumulator, pa.Table.from_arrays([pa.array([[3]])], ['a']))
+    expected = text_format.Parse(
+        """
+        features {
+          path {
+            step: "a"
+          }
+          custom_stats {
+            name: "_ValueCounter"
+            num: 3
+          }
+          custom_stats {
+            name: "_ExampleCounter"
+            num: 2
+          }
+        }""", statistics_pb2.DatasetFeatureStatistics())
+    compare.assertProtoEqual(self, generator.extract_output(accumulator),
+                             expected)
+
   def test_filter_features(self):
     input_table = pa.Table.from_arrays([
         pa.array([[]], type=pa.list_(pa.int64())),
@@ -2116,6 +2236,25 @@ class StatsImplTest(parameterized.TestCase):
     expected = pa.Table.from_arrays([])
     self.assertEqual(set(actual.schema.names), set(expected.schema.names))
 
+  def test_filter_features_all_whitelisted(self):
+    input_table = pa.Table.from_arrays([
+        pa.array([[]], type=pa.list_(pa.int64())),
+        pa.array([[]], type=pa.list_(pa.int64())),
+    ], ['a', 'b'])
+    actual = stats_impl._filter_features(input_table, ['b', 'a', 'c'])
+    self.assertIs(actual, input_table)
+
+  def test_filter_features_missing_whitelisted_feature(self):
+    input_table = pa.Table.from_arrays([
+        pa.array([[]], type=pa.list_(pa.int64())),
+        pa.array([[]], type=pa.list_(pa.int64())),
+    ], ['a', 'b'])
+    actual = stats_impl._filter_features(input_table, ['a', 'c'])
+    expected = pa.Table.from_arrays([
+        pa.array([[]], type=pa.list_(pa.int64())),
+    ], ['a'])
+    self.assertEqual(set(actual.schema.names), set(expected.schema.names))
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -56,7 +56,8 @@ class StatsOptions(object):
       infer_type_from_schema = False,
       desired_batch_size = None,
       enable_semantic_domain_stats = False,
-      semantic_domain_stats_sample_rate = None):
+      semantic_domain_stats_sample_rate = None,
+      desired_hot_key_fanout = 8):
     """Initializes statistics options.
 
     Args:
@@ -106,11 +107,19 @@ class StatsOptions(object):
           must be provided. This flag is used only when generating statistics
           on CSV data.
       desired_batch_size: An optional number of examples to include in each
-        batch that is passed to the statistics generators.
+        batch that is passed to the statistics generators. If not specified,
+        the input is decoded in batches of a fixed default size, which the
+        statistics generators may combine into larger batches based on the
+        time taken by each batch.
       enable_semantic_domain_stats: If True statistics for semantic domains are
         generated (e.g: image, text domains).
       semantic_domain_stats_sample_rate: An optional sampling rate for semantic
         domain statistics. If specified, statistics is computed over a sample.
+      desired_hot_key_fanout: An optional fanout used when combining the
+        statistics of each slice. Either a positive integer, or a function that
+        takes a slice key and returns the fanout for that slice, which allows a
+        higher fanout for slices that are known to be heavy. If None, no fanout
+        is used.
     """
     self.generators = generators
     self.feature_whitelist = feature_whitelist
@@ -131,6 +140,7 @@ class StatsOptions(object):
     self.desired_batch_size = desired_batch_size
     self.enable_semantic_domain_stats = enable_semantic_domain_stats
     self.semantic_domain_stats_sample_rate = semantic_domain_stats_sample_rate
+    self.desired_hot_key_fanout = desired_hot_key_fanout
 
   @property
   def generators(self):
@@ -285,3 +295,16 @@ class StatsOptions(object):
         raise ValueError('Invalid semantic_domain_stats_sample_rate %f'
                          % semantic_domain_stats_sample_rate)
     self._semantic_domain_stats_sample_rate = semantic_domain_stats_sample_rate
+
+  @property
+  def desired_hot_key_fanout(self):
+    return self._desired_hot_key_fanout
+
+  @desired_hot_key_fanout.setter
+  def desired_hot_key_fanout(
+      self, desired_hot_key_fanout):
+    if (desired_hot_key_fanout is not None and
+        not callable(desired_hot_key_fanout) and desired_hot_key_fanout < 1):
+      raise ValueError('Invalid desired_hot_key_fanout %r' %
+                       desired_hot_key_fanout)
+    self._desired_hot_key_fanout = desired_hot_key_fanout
@@ -203,6 +203,22 @@ INVALID_STATS_OPTIONS = [
         'exception_type': ValueError,
         'error_message': 'Invalid semantic_domain_stats_sample_rate 2'
     },
+    {
+        'testcase_name': 'desired_hot_key_fanout_zero',
+        'stats_options_kwargs': {
+            'desired_hot_key_fanout': 0
+        },
+        'exception_type': ValueError,
+        'error_message': 'Invalid desired_hot_key_fanout 0'
+    },
+    {
+        'testcase_name': 'desired_hot_key_fanout_non_integer',
+        'stats_options_kwargs': {
+            'desired_hot_key_fanout': 0.5
+        },
+        'exception_type': ValueError,
+        'error_message': 'Invalid desired_hot_key_fanout 0.5'
+    },
 ]
 
 
@@ -214,6 +230,15 @@ class StatsOptionsTest(parameterized.TestCase):
     with self.assertRaisesRegexp(exception_type, error_message):
       stats_options.StatsOptions(**stats_options_kwargs)
 
+  def test_callable_desired_hot_key_fanout(self):
+    fanout_fn = lambda slice_key: 2
+    options = stats_options.StatsOptions(desired_hot_key_fanout=fanout_fn)
+    self.assertIs(options.desired_hot_key_fanout, fanout_fn)
+
+  def test_no_desired_hot_key_fanout(self):
+    options = stats_options.StatsOptions(desired_hot_key_fanout=None)
+    self.assertIsNone(options.desired_hot_key_fanout)
+
 
 if __name__ == '__main__':
   absltest.main()
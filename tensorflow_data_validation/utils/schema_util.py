@@ -74,6 +74,19 @@ def get_feature(schema,
 FEATURE_DOMAIN = Union[schema_pb2.IntDomain, schema_pb2.FloatDomain,
                        schema_pb2.StringDomain, schema_pb2.BoolDomain]
 
+# Maps each feature-level domain proto type to the domain_info field of a
+# Feature that holds it.
+_FEATURE_DOMAIN_FIELDS_BY_TYPE = {
+    schema_pb2.IntDomain: 'int_domain',
+    schema_pb2.FloatDomain: 'float_domain',
+    schema_pb2.StringDomain: 'string_domain',
+    schema_pb2.BoolDomain: 'bool_domain',
+}
+
+# Names of the domain_info fields of a Feature that hold the domain itself.
+_FEATURE_DOMAIN_FIELDS = frozenset(
+    six.itervalues(_FEATURE_DOMAIN_FIELDS_BY_TYPE))
+
 
 def get_domain(schema,
                feature_path
@@ -106,18 +119,12 @@ def get_domain(schema,
     raise ValueError('Feature %s has no domain associated with it.' %
                      feature_path)
 
-  if domain_info == 'int_domain':
-    return feature.int_domain
-  elif domain_info == 'float_domain':
-    return feature.float_domain
-  elif domain_info == 'string_domain':
-    return feature.string_domain
+  if domain_info in _FEATURE_DOMAIN_FIELDS:
+    return getattr(feature, domain_info)
   elif domain_info == 'domain':
     for domain in schema.string_domain:
       if domain.name == feature.domain:
         return domain
-  elif domain_info == 'bool_domain':
-    return feature.bool_domain
 
   raise ValueError('Feature %s has an unsupported domain %s.' %
                    (feature_path, domain_info))
@@ -170,23 +177,14 @@ def set_domain(schema, feature_path,
   if feature.WhichOneof('domain_info') is not None:
     logging.warning('Replacing existing domain of feature "%s".', feature_path)
 
-  if isinstance(domain, schema_pb2.IntDomain):
-    feature.int_domain.CopyFrom(domain)
-  elif isinstance(domain, schema_pb2.FloatDomain):
-    feature.float_domain.CopyFrom(domain)
-  elif isinstance(domain, schema_pb2.StringDomain):
-    feature.string_domain.CopyFrom(domain)
-  elif isinstance(domain, schema_pb2.BoolDomain):
-    feature.bool_domain.CopyFrom(domain)
+  domain_field = _FEATURE_DOMAIN_FIELDS_BY_TYPE.get(type(domain))
+  if domain_field is not None:
+    getattr(feature, domain_field).CopyFrom(domain)
   else:
     # If we have a domain name provided as input, check if we have a valid
     # global string domain with the specified name.
-    found_domain = False
-    for global_domain in schema.string_domain:
-      if global_domain.name == domain:
-        found_domain = True
-        break
-    if not found_domain:
+    if not any(global_domain.name == domain
+               for global_domain in schema.string_domain):
       raise ValueError('Invalid global string domain "{}".'.format(domain))
     feature.domain = domain
 
@@ -219,8 +217,10 @@ def load_schema_text(input_path):
     A Schema protocol buffer.
   """
   schema = schema_pb2.Schema()
-  schema_text = file_io.read_file_to_string(input_path)
-  text_format.Parse(schema_text, schema)
+  # Parse the file line by line, which avoids reading the whole schema text
+  # into a string and then splitting it into lines.
+  with file_io.FileIO(input_path, 'r') as f:
+    text_format.ParseLines(f, schema)
   return schema
 
 
@@ -229,9 +229,9 @@ def is_categorical_feature(feature):
   if feature.type == schema_pb2.BYTES:
     return True
   elif feature.type == schema_pb2.INT:
-    return ((feature.HasField('int_domain') and
-             feature.int_domain.is_categorical) or
-            feature.HasField('bool_domain'))
+    domain_info = feature.WhichOneof('domain_info')
+    return (domain_info == 'bool_domain' or
+            (domain_info == 'int_domain' and feature.int_domain.is_categorical))
   else:
     return False
 
@@ -304,18 +304,20 @@ def _look_up_feature(feature_name,
 def _get_all_leaf_features(
     schema
 ):
-  """Returns all leaf features in a schema."""
-  def _recursion_helper(
-      parent_path,
-      feature_container,
-      result):
-    for f in feature_container:
-      feature_path = parent_path.child(f.name)
+  """Yields the path and the Feature proto of all leaf features in a schema."""
+  # Each entry of the stack holds the path steps of a STRUCT feature (or of
+  # the root) and an iterator over its child features that remain to be
+  # visited. Iterating depth-first this way keeps the features in schema
+  # order, and FeaturePaths are only created for the leaves.
+  stack = [((), iter(schema.feature))]
+  while stack:
+    parent_steps, feature_iterator = stack[-1]
+    for f in feature_iterator:
+      steps = parent_steps + (f.name,)
       if f.type != schema_pb2.STRUCT:
-        result.append((feature_path, f))
+        yield types.FeaturePath(steps), f
       else:
-        _recursion_helper(feature_path, f.struct_domain.feature, result)
-
-  result = []
-  _recursion_helper(types.FeaturePath([]), schema.feature, result)
-  return result
+        stack.append((steps, iter(f.struct_domain.feature)))
+        break
+    else:
+      stack.pop()
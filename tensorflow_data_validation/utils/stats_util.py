@@ -164,7 +164,7 @@ def _make_feature_stats_proto(
   """
 
   result = statistics_pb2.FeatureNameStatistics()
-  result.path.CopyFrom(feature_path.to_proto())
+  result.path.step.extend(feature_path.steps())
 
   # Sort alphabetically by statistic name to have deterministic ordering
   stat_names = sorted(stats_values.keys())